@@ -0,0 +1,151 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+
+User = get_user_model()
+
+COUNT_POSTS = 13
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='writer', first_name='Лев', last_name='Толстой'
+        )
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='api-group', description='-'
+        )
+        for i in range(COUNT_POSTS):
+            Post.objects.create(
+                author=cls.author, text=f'Пост {i}', group=cls.group
+            )
+        cls.post = Post.objects.latest('created')
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_pages(self):
+        url = reverse('api:index')
+        data = self.client.get(url).json()
+        ids = [post['id'] for post in data['results']]
+        self.assertEqual(set(data['results'][0]), {
+            'id', 'text', 'created', 'author', 'group', 'image',
+            'comments_count',
+        })
+        while data['next']:
+            data = self.client.get(url, {'cursor': data['next']}).json()
+            ids += [post['id'] for post in data['results']]
+        self.assertEqual(
+            ids,
+            list(Post.objects.order_by('-created', '-pk').values_list(
+                'pk', flat=True
+            ))
+        )
+
+    def test_sparse_fields_and_limit(self):
+        data = self.client.get(
+            reverse('api:index'), {'fields': 'id,text', 'limit': 3}
+        ).json()
+        self.assertEqual(len(data['results']), 3)
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        for params in ({'fields': 'id,password'}, {'limit': 1000}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('api:index'), params)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.BAD_REQUEST
+                )
+
+    def test_detail_endpoints(self):
+        data = self.client.get(
+            reverse('api:group_list', kwargs={'slug': self.group.slug})
+        ).json()
+        self.assertEqual(data['group']['title'], 'Группа')
+        data = self.client.get(
+            reverse('api:profile', kwargs={'username': 'writer'})
+        ).json()
+        self.assertEqual(data['author']['posts_count'], COUNT_POSTS)
+        self.assertEqual(data['author']['followers_count'], 1)
+        data = self.client.get(
+            reverse('api:post_detail', kwargs={'post_id': self.post.pk})
+        ).json()
+        self.assertEqual(data['post']['author'], 'writer')
+        self.assertEqual(data['comments'][0]['text'], 'Комментарий')
+        missing = (
+            reverse('api:group_list', kwargs={'slug': 'none'}),
+            reverse('api:profile', kwargs={'username': 'none'}),
+            reverse('api:post_detail', kwargs={'post_id': 0}),
+        )
+        for url in missing:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_follow_feed(self):
+        url = reverse('api:follow_index')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_cache_headers(self):
+        url = reverse('api:index')
+        response = self.client.get(url)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.assertEqual(len(queries), 0)
+        Post.objects.create(author=self.author, text='Новый')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_author_rename_changes_etags(self):
+        urls = (
+            reverse('api:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('api:group_list', kwargs={'slug': self.group.slug}),
+        )
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        self.author.username = 'renamed'
+        self.author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertContains(response, 'renamed')
+
+    def test_follow_changes_profile_etags(self):
+        urls = (
+            reverse('api:profile', kwargs={'username': 'writer'}),
+            reverse('api:profile', kwargs={'username': 'reader'}),
+        )
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        Follow.objects.create(user=self.author, author=self.reader)
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url]
+                )
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+        author = self.client.get(urls[1]).json()['author']
+        self.assertEqual(author['followers_count'], 1)
@@ -0,0 +1,264 @@
+"""JSON API только для чтения.
+
+Отдаёт те же данные, что и HTML-страницы posts, но без шаблонов:
+строки читаются через values(), поля выбираются параметром fields,
+листинги разбиты на страницы курсором. ETag строится из поколений кэша,
+поэтому повторный запрос с If-None-Match не обращается к постам.
+"""
+import hashlib
+from functools import partial, wraps
+from http import HTTPStatus
+
+from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_safe
+
+from posts import generations, timeline
+from posts.models import Comment, Group, Post, User
+from posts.utils import get_pagi
+from posts.views import COMMENTS_CUT, POSTS_CUT
+
+
+MAX_LIMIT = 100
+CACHE_SECONDS = 60
+
+# Поле ответа -> путь в values().
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+}
+AUTHOR_FIELDS = {
+    'id': 'id',
+    'username': 'username',
+    'first_name': 'first_name',
+    'last_name': 'last_name',
+    'posts_count': 'stats__posts_count',
+    'followers_count': 'stats__followers_count',
+    'following_count': 'stats__following_count',
+}
+GROUP_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'slug': 'slug',
+    'description': 'description',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'author': 'author__username',
+    'text': 'text',
+    'created': 'created',
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def json_response(data, status=HTTPStatus.OK):
+    return JsonResponse(
+        data, status=status, json_dumps_params={'ensure_ascii': False}
+    )
+
+
+def _serialize(row, fields):
+    data = {name: row[path] for name, path in fields.items()}
+    if data.get('created') is not None:
+        data['created'] = data['created'].isoformat()
+    if 'image' in data:
+        image = data['image']
+        data['image'] = (
+            Post._meta.get_field('image').storage.url(image)
+            if image else None
+        )
+    return data
+
+
+def _post_fields(request):
+    """Поля постов из параметра fields, например ?fields=id,text."""
+    requested = request.GET.get('fields')
+    if not requested:
+        return POST_FIELDS
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = set(names) - set(POST_FIELDS)
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    return {name: POST_FIELDS[name] for name in names}
+
+
+def _limit(request, default):
+    try:
+        limit = int(request.GET.get('limit', default))
+    except ValueError:
+        raise BadRequest('limit должен быть целым числом')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise BadRequest(f'limit должен быть от 1 до {MAX_LIMIT}')
+    return limit
+
+
+def _page(request, queryset, fields, default_limit, descending=True,
+          paginator=get_pagi):
+    # id и created нужны курсору, даже если их нет среди полей ответа.
+    paths = {'id', 'created', *fields.values()}
+    page = paginator(
+        queryset.values(*paths), _limit(request, default_limit), descending
+    ).get_page(request.GET.get('cursor'))
+    return {
+        'results': [_serialize(row, fields) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+def _posts_page(request, queryset, paginator=get_pagi):
+    return _page(
+        request, queryset, _post_fields(request), POSTS_CUT,
+        paginator=paginator
+    )
+
+
+def api_view(namespaces, private=False):
+    """Обвязка представления API.
+
+    namespaces(request, **kwargs) возвращает пространства имён поколений,
+    от которых зависит ответ, или None, если объекта нет. Из них и полного
+    пути запроса строится ETag.
+    """
+    def etag(request, **kwargs):
+        found = namespaces(request, **kwargs)
+        if found is None:
+            return None
+        return hashlib.md5(
+            f'{generations.get_generation(*found)}|{request.get_full_path()}'
+            .encode()
+        ).hexdigest()
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, **kwargs):
+            try:
+                return view(request, **kwargs)
+            except BadRequest as error:
+                return json_response(
+                    {'error': str(error)}, HTTPStatus.BAD_REQUEST
+                )
+
+        wrapper = condition(etag_func=etag)(wrapper)
+        if private:
+            wrapper = cache_control(private=True, no_cache=True)(wrapper)
+        else:
+            wrapper = cache_control(
+                public=True, max_age=CACHE_SECONDS
+            )(wrapper)
+        return require_safe(wrapper)
+
+    return decorator
+
+
+def not_found():
+    return json_response({'error': 'Не найдено'}, HTTPStatus.NOT_FOUND)
+
+
+@api_view(lambda request: (generations.POSTS, generations.GROUPS))
+def index(request):
+    return json_response(_posts_page(request, Post.objects.all()))
+
+
+def _group_namespaces(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    return None if group_id is None else (generations.group_ns(group_id),)
+
+
+@api_view(_group_namespaces)
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).values(
+        *GROUP_FIELDS.values()
+    ).first()
+    if group is None:
+        return not_found()
+    return json_response({
+        'group': _serialize(group, GROUP_FIELDS),
+        **_posts_page(request, Post.objects.filter(group_id=group['id'])),
+    })
+
+
+def _profile_namespaces(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return None
+    return generations.author_ns(author_id), generations.GROUPS
+
+
+@api_view(_profile_namespaces)
+def profile(request, username):
+    author = User.objects.filter(username=username).values(
+        *AUTHOR_FIELDS.values()
+    ).first()
+    if author is None:
+        return not_found()
+    data = _serialize(author, AUTHOR_FIELDS)
+    for field in ('posts_count', 'followers_count', 'following_count'):
+        data[field] = data[field] or 0
+    return json_response({
+        'author': data,
+        **_posts_page(request, Post.objects.filter(author_id=author['id'])),
+    })
+
+
+def _post_namespaces(request, post_id):
+    # Ответ содержит имя автора и слаг группы, поэтому зависит и от них.
+    found = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id'
+    ).first()
+    if found is None:
+        return None
+    author_id, group_id = found
+    namespaces = [generations.post_ns(post_id), generations.author_ns(author_id)]
+    if group_id is not None:
+        namespaces.append(generations.group_ns(group_id))
+    return namespaces
+
+
+@api_view(_post_namespaces)
+def post_detail(request, post_id):
+    fields = _post_fields(request)
+    post = Post.objects.filter(pk=post_id).values(*fields.values()).first()
+    if post is None:
+        return not_found()
+    comments = _page(
+        request, Comment.objects.filter(post_id=post_id), COMMENT_FIELDS,
+        COMMENTS_CUT, descending=False
+    )
+    return json_response({
+        'post': _serialize(post, fields),
+        'comments': comments.pop('results'),
+        **comments,
+    })
+
+
+def _feed_namespaces(request):
+    if not request.user.is_authenticated:
+        return None
+    return generations.POSTS, generations.following_ns(request.user.pk)
+
+
+@api_view(_feed_namespaces, private=True)
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return json_response(
+            {'error': 'Требуется вход'}, HTTPStatus.UNAUTHORIZED
+        )
+    return json_response(
+        _posts_page(
+            request, Post.objects.all(),
+            partial(timeline.get_feed, request.user)
+        )
+    )
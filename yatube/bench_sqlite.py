@@ -0,0 +1,66 @@
+"""Сравнение профилей SQLite под конкурентной записью.
+
+Для каждого профиля (default и concurrent из settings.SQLITE_PROFILES)
+копирует базу во временный файл и запускает loadtest.py на
+представлениях, которые пишут в базу:
+
+    python manage.py generate_data --posts 100000
+    python bench_sqlite.py --concurrency 16 --requests 300
+"""
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+WRITE_VIEWS = ('post_create:submit', 'add_comment', 'profile_follow')
+# journal_mode хранится в самом файле базы, поэтому копия для профиля
+# default переводится обратно в журнал отката.
+JOURNAL_MODES = {'default': 'DELETE', 'concurrent': 'WAL'}
+
+
+def copy_database(source, target, journal_mode):
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+        dst.execute(f'PRAGMA journal_mode={journal_mode}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--database',
+        default=os.getenv(
+            'DATABASE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')
+        )
+    )
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for profile, journal_mode in JOURNAL_MODES.items():
+            path = os.path.join(directory, f'{profile}.sqlite3')
+            copy_database(args.database, path, journal_mode)
+            print(f'\nПрофиль {profile}')
+            subprocess.run(
+                [
+                    sys.executable, os.path.join(BASE_DIR, 'loadtest.py'),
+                    '--concurrency', str(args.concurrency),
+                    '--requests', str(args.requests),
+                    '--views', *WRITE_VIEWS,
+                ],
+                env={
+                    **os.environ,
+                    'SQLITE_PROFILE': profile,
+                    'DATABASE_PATH': path,
+                    'THUMBNAIL_WORKERS': '0',
+                },
+                check=True,
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+import os
+import pickle
+import sqlite3
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import metrics
+
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL,'
+    ' expires REAL, accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+# Условие «запись не истекла»; параметр — текущее время.
+ALIVE = '(expires IS NULL OR expires > ?)'
+SQLITE_INT = range(-2 ** 63, 2 ** 63)
+# INSERT ... ON CONFLICT DO UPDATE появился в SQLite 3.24.
+MIN_SQLITE_VERSION = (3, 24, 0)
+
+
+def _dump(value):
+    # Целые числа хранятся как INTEGER, чтобы incr выполнялся одним
+    # UPDATE внутри SQLite; остальное — pickle.
+    if type(value) is int and value in SQLITE_INT:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _load(value):
+    return value if isinstance(value, int) else pickle.loads(value)
+
+
+def _first(cursor):
+    # fetchall дочитывает запрос до конца: незавершённый запрос держит
+    # транзакцию открытой.
+    rows = cursor.fetchall()
+    return rows[0] if rows else None
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в файле SQLite, общий для всех процессов на машине.
+
+    LOCATION — путь к файлу. Файл открыт в режиме WAL, поэтому чтения
+    не ждут записей, а горячие страницы лежат в общем страничном кэше
+    ОС (mmap). Раз в CULL_EVERY записанных ключей проверяется
+    переполнение MAX_ENTRIES: удаляются истёкшие записи, затем доля
+    1/CULL_FREQUENCY давно не читавшихся (LRU). Время чтения обновляется
+    не чаще раза в TOUCH_INTERVAL секунд на ключ, чтобы частые чтения
+    не превращались в записи.
+    """
+
+    def __init__(self, location, params):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            raise ImproperlyConfigured(
+                'SQLiteCache требует SQLite 3.24 или новее, установлена '
+                f'{sqlite3.sqlite_version}'
+            )
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._touch_interval = options.get('TOUCH_INTERVAL', 10)
+        self._cull_every = options.get('CULL_EVERY', 100)
+        self._written = 0
+        self._connection = None
+        self._pid = None
+
+    @property
+    def _db(self):
+        # Экземпляр кэша у Django свой в каждом потоке, а соединение,
+        # открытое до fork, в дочернем процессе использовать нельзя.
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA mmap_size=268435456')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _touch_stale(self, keys, accessed, now):
+        stale = [
+            (now, key) for key, at in zip(keys, accessed)
+            if at < now - self._touch_interval
+        ]
+        if stale:
+            self._db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', stale
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        now = time.time()
+        row = _first(self._db.execute(
+            f'SELECT value, accessed FROM cache WHERE key = ? AND {ALIVE}',
+            (key, now)
+        ))
+        metrics.record_cache(row is not None)
+        if row is None:
+            return default
+        self._touch_stale([key], [row[1]], now)
+        return _load(row[0])
+
+    def get_many(self, keys, version=None):
+        made = {self.make_key(key, version): key for key in keys}
+        for key in made:
+            self.validate_key(key)
+        if not made:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            'SELECT key, value, accessed FROM cache WHERE key IN '
+            f'({", ".join("?" * len(made))}) AND {ALIVE}',
+            (*made, now)
+        ).fetchall()
+        found = {key: value for key, value, _ in rows}
+        for key in made:
+            metrics.record_cache(key in found)
+        self._touch_stale(
+            [row[0] for row in rows], [row[2] for row in rows], now
+        )
+        return {made[key]: _load(value) for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version)
+            self.validate_key(key)
+            rows.append((key, _dump(value), expires, now))
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(
+                'INSERT INTO cache (key, value, expires, accessed) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+                'value = excluded.value, expires = excluded.expires, '
+                'accessed = excluded.accessed',
+                rows
+            )
+            self._written += len(rows)
+            if self._written >= self._cull_every:
+                self._written = 0
+                self._cull(now)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        now = time.time()
+        # Занятый ключ перезаписывается, только если запись истекла.
+        cursor = self._db.execute(
+            'INSERT INTO cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, _dump(value), self.get_backend_timeout(timeout), now, now)
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        # Атомарно для всех процессов: сложение выполняет сам UPDATE,
+        # а BEGIN IMMEDIATE не даёт никому изменить ключ до SELECT.
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = db.execute(
+                'UPDATE cache SET value = value + ? WHERE key = ? AND '
+                f"typeof(value) = 'integer' AND {ALIVE}",
+                (delta, key, time.time())
+            )
+            if cursor.rowcount != 1:
+                raise ValueError(f"Key '{key}' not found")
+            value = _first(db.execute(
+                'SELECT value FROM cache WHERE key = ?', (key,)
+            ))[0]
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        cursor = self._db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {ALIVE}',
+            (self.get_backend_timeout(timeout), key, time.time())
+        )
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return _first(self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time())
+        )) is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        made = [self.make_key(key, version) for key in keys]
+        for key in made:
+            self.validate_key(key)
+        self._db.executemany(
+            'DELETE FROM cache WHERE key = ?', [(key,) for key in made]
+        )
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _cull(self, now):
+        count = _first(self._db.execute('SELECT COUNT(*) FROM cache'))[0]
+        if count <= self._max_entries:
+            return
+        count -= self._db.execute(
+            'DELETE FROM cache WHERE expires <= ?', (now,)
+        ).rowcount
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            self._db.execute('DELETE FROM cache')
+            return
+        self._db.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY accessed LIMIT ?)',
+            (max(1, count // self._cull_frequency),)
+        )
@@ -0,0 +1,103 @@
+"""Поколения кэша: ключи, которые меняются при изменении данных.
+
+Фрагменты кэшируются надолго, а в ключ включается номер поколения
+нужных пространств имён. При изменении данных поколение увеличивается,
+и следующая отрисовка уходит под новым ключом; старые записи просто
+вытесняются по таймауту.
+
+fetch и get_or_refresh защищают от одновременного пересчёта: пока один
+запрос обновляет значение, остальные получают прежнее.
+"""
+import math
+import random
+import time
+
+from django.core.cache import cache
+
+
+def _key(namespace):
+    return f'generation:{namespace}'
+
+
+def _initial():
+    # Если счётчик вытеснен из кэша, начинаем с текущего времени в мс,
+    # а не с единицы: иначе можно снова выдать номер, под которым
+    # уже лежат устаревшие фрагменты.
+    return int(time.time() * 1000)
+
+
+def get_generation(*namespaces):
+    """Строка с поколениями пространств имён, пригодная для ключа кэша."""
+    keys = [_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    values = []
+    for key in keys:
+        value = found.get(key)
+        if value is None:
+            cache.add(key, _initial(), None)
+            value = cache.get(key)
+        values.append(str(value))
+    return '-'.join(values)
+
+
+def bump(*namespaces):
+    """Сдвигает поколения: все ключи с ними перестают совпадать."""
+    for namespace in namespaces:
+        key = _key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial(), None)
+
+
+# Мягкий таймаут разбрасывается на долю JITTER, чтобы записи,
+# созданные одновременно, не истекали одновременно.
+JITTER = 0.1
+# Сколько устаревшее значение ещё можно отдавать, пока его пересчитывают.
+STALE_SECONDS = 24 * 60 * 60
+LOCK_SECONDS = 30
+
+
+def _is_fresh(entry, version, beta):
+    _, entry_version, delta, expires = entry
+    if entry_version != version:
+        return False
+    # XFetch: чем ближе срок и чем дольше пересчёт, тем вероятнее,
+    # что запрос обновит значение заранее, до его истечения.
+    return time.time() - delta * beta * math.log(random.random()) < expires
+
+
+def fetch(key, compute, timeout, version=None, beta=1.0):
+    """Значение из кэша с пересчётом без «лавины» запросов.
+
+    Значение считается свежим timeout секунд (с разбросом) и пока
+    version совпадает с сохранённой, например с поколением кэша.
+    Устаревшее значение пересчитывает один запрос, взявший блокировку,
+    а остальные до STALE_SECONDS получают старое. Если значения нет
+    вовсе, compute() вызывает каждый запрос.
+
+    Возвращает (значение, current): current ложно, если отдано значение
+    прежней версии.
+    """
+    entry = cache.get(key)
+    if entry is not None and _is_fresh(entry, version, beta):
+        return entry[0], True
+    lock = f'lock:{key}'
+    locked = cache.add(lock, 1, LOCK_SECONDS)
+    if entry is not None and not locked:
+        return entry[0], entry[1] == version
+    try:
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        expires = time.time() + timeout * random.uniform(1 - JITTER, 1)
+        cache.set(key, (value, version, delta, expires), STALE_SECONDS)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return value, True
+
+
+def get_or_refresh(key, compute, timeout, version=None, beta=1.0):
+    """Как fetch, но только значение."""
+    return fetch(key, compute, timeout, version, beta)[0]
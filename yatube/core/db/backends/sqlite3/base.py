@@ -0,0 +1,49 @@
+"""SQLite для нескольких конкурентных WSGI-воркеров.
+
+Дополнительные ключи OPTIONS (как в новых версиях Django):
+
+* init_command — PRAGMA через «;», выполняются при открытии соединения;
+* transaction_mode — как начинать транзакции atomic: DEFERRED,
+  IMMEDIATE или EXCLUSIVE.
+
+С transaction_mode=IMMEDIATE транзакция берёт блокировку записи сразу
+в BEGIN. Конкурирующий писатель ждёт её в пределах busy_timeout, а не
+получает «database is locked» при попытке повысить блокировку чтения
+посреди транзакции.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        options = self.settings_dict['OPTIONS']
+        self.init_commands = [
+            command.strip()
+            for command in options.get('init_command', '').split(';')
+            if command.strip()
+        ]
+        self.transaction_mode = options.get(
+            'transaction_mode', 'DEFERRED'
+        ).upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f'transaction_mode должен быть одним из {TRANSACTION_MODES}'
+            )
+        params = super().get_connection_params()
+        params.pop('init_command', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for command in self.init_commands:
+            conn.execute(command)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
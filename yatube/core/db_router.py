@@ -0,0 +1,55 @@
+"""Маршрутизация чтения на реплики базы данных.
+
+Реплики перечислены в settings.DATABASE_REPLICAS. На них уходят только
+запросы на чтение внутри read_from_replicas — его включает
+ReplicaMiddleware для безопасных запросов. Всё остальное (запись,
+формы, команды, сигналы, транзакции) работает с основной базой.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_state = threading.local()
+
+
+@contextmanager
+def read_from_replicas(enabled=True):
+    previous = getattr(_state, 'enabled', False)
+    _state.enabled = enabled
+    try:
+        yield
+    finally:
+        _state.enabled = previous
+
+
+def replicas_enabled():
+    return bool(settings.DATABASE_REPLICAS) and getattr(
+        _state, 'enabled', False
+    )
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Внутри транзакции читаем то, что только что записали.
+        if (not replicas_enabled()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        # Явно: иначе Django записал бы объект в базу, из которой
+        # он прочитан, то есть в реплику.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Реплики получают схему вместе с данными от основной базы.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
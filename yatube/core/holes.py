@@ -0,0 +1,134 @@
+"""Кэш целых страниц с «дырками» для данных посетителя.
+
+Страница кэшируется одна на всех посетителей, а на месте частей,
+зависящих от пользователя (меню, кнопка подписки, форма комментария),
+в неё попадают метки тега {% hole %}. При выдаче метки заменяются
+фрагментами, которые строят зарегистрированные функции. Поэтому
+вошедшие пользователи получают страницы из кэша так же часто,
+как анонимные.
+"""
+import hashlib
+import re
+from functools import wraps
+from urllib.parse import parse_qsl, urlencode
+
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+
+from .caching import fetch
+from .metrics import timing_templates
+
+
+PAGE_SECONDS = 24 * 60 * 60
+# Параметры меток закодированы urlencode, поэтому «>» в них не бывает.
+MARKER = re.compile(r'<!--hole:(\w+)\?([^>]*)-->')
+
+_registry = {}
+
+
+def register(name, template_name):
+    """Регистрирует дырку: функция(request, **params) даёт контекст шаблона.
+
+    Параметры приходят строками — так же, как из метки в кэше.
+    """
+    def decorator(func):
+        _registry[name] = (template_name, func)
+        return func
+
+    return decorator
+
+
+def render_hole(request, name, params):
+    template_name, func = _registry[name]
+    context = func(request, **params)
+    with timing_templates():
+        return render_to_string(template_name, context, request=request)
+
+
+def punching(request):
+    """Отрисовывается ли страница для кэша, то есть с метками."""
+    return getattr(request, '_punch_holes', False)
+
+
+def marker(name, params):
+    return f'<!--hole:{name}?{urlencode(params)}-->'
+
+
+def fill(request, content):
+    return MARKER.sub(
+        lambda match: render_hole(
+            request, match[1],
+            dict(parse_qsl(match[2], keep_blank_values=True))
+        ),
+        content
+    )
+
+
+def mark_stale(request):
+    """Страница собрана из устаревших фрагментов и не кэшируется."""
+    if request is not None:
+        request._stale_page = True
+
+
+class _Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def cache_page(version):
+    """Кэширует страницу с дырками под версией version(request, **kwargs).
+
+    Версия — строка из поколений кэша, от которых зависит страница,
+    или None, если страницу кэшировать нельзя. Устаревшую страницу
+    пересчитывает один запрос, остальные получают прежнюю с новыми
+    дырками и запретом сохранять её в браузере: её ETag уже новый.
+    """
+    def render(view, request, kwargs):
+        request._punch_holes = True
+        try:
+            response = view(request, **kwargs)
+        finally:
+            request._punch_holes = False
+        if (response.status_code != 200 or response.streaming
+                or getattr(request, '_stale_page', False)):
+            raise _Uncacheable(response)
+        return response.content.decode(response.charset)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, **kwargs):
+            page_version = None
+            if request.method in ('GET', 'HEAD'):
+                page_version = version(request, **kwargs)
+            if page_version is None:
+                return view(request, **kwargs)
+            key = 'page:' + hashlib.md5(
+                request.get_full_path().encode()
+            ).hexdigest()
+            try:
+                content, current = fetch(
+                    key, lambda: render(view, request, kwargs),
+                    PAGE_SECONDS, version=page_version
+                )
+            except _Uncacheable as error:
+                response = error.response
+                if not response.streaming:
+                    response.content = fill(
+                        request, response.content.decode(response.charset)
+                    )
+                current = not getattr(request, '_stale_page', False)
+            else:
+                response = HttpResponse(fill(request, content))
+            if not current:
+                patch_cache_control(response, no_store=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+@register('user_nav', 'includes/user_nav.html')
+def user_nav(request):
+    return {}
@@ -0,0 +1,199 @@
+"""Метрики производительности запросов.
+
+Во время обработки запроса счётчики копятся в объекте RequestMetrics,
+привязанном к потоку. После ответа они попадают в заголовок
+Server-Timing и в гистограммы по имени маршрута, которые отдаются
+в текстовом формате Prometheus. Гистограммы хранятся в памяти
+процесса: при нескольких воркерах каждый отдаёт свои значения.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django import shortcuts
+
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    """Счётчики одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.sql_count += 1
+
+    def server_timing(self, total):
+        return ', '.join((
+            f'db;dur={self.sql_time * 1000:.1f};'
+            f'desc="{self.sql_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="hits={self.cache_hits} '
+            f'misses={self.cache_misses}"',
+            f'total;dur={total * 1000:.1f}',
+        ))
+
+
+def start():
+    _local.metrics = RequestMetrics()
+    return _local.metrics
+
+
+def current():
+    """Метрики текущего запроса или None вне запроса."""
+    return getattr(_local, 'metrics', None)
+
+
+def finish():
+    _local.metrics = None
+
+
+def record_cache(hit):
+    metrics = current()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+@contextmanager
+def timing_templates():
+    """Добавляет время блока к отрисовке шаблонов, без вложенных блоков."""
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    metrics.template_depth += 1
+    try:
+        yield
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_time += time.perf_counter() - started
+
+
+def render(request, template_name, context=None, **kwargs):
+    """django.shortcuts.render, время которого попадает в метрики."""
+    with timing_templates():
+        return shortcuts.render(request, template_name, context, **kwargs)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    """Агрегированные метрики процесса по имени маршрута."""
+
+    HISTOGRAMS = (
+        ('request_duration_seconds', 'Время ответа.', DURATION_BUCKETS),
+        ('db_duration_seconds', 'Время SQL-запросов.', DURATION_BUCKETS),
+        ('template_duration_seconds', 'Время отрисовки шаблонов.',
+         DURATION_BUCKETS),
+        ('db_queries', 'Число SQL-запросов на запрос.', QUERY_BUCKETS),
+    )
+    COUNTERS = (
+        ('cache_hits_total', 'Попадания в кэш.'),
+        ('cache_misses_total', 'Промахи кэша.'),
+    )
+
+    def __init__(self, prefix='yatube'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {
+                name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+                for name, _, buckets in self.HISTOGRAMS
+            }
+            self.counters = {
+                name: defaultdict(int) for name, _ in self.COUNTERS
+            }
+
+    def observe(self, view, metrics, total):
+        with self._lock:
+            self.histograms['request_duration_seconds'][view].observe(total)
+            self.histograms['db_duration_seconds'][view].observe(
+                metrics.sql_time
+            )
+            self.histograms['template_duration_seconds'][view].observe(
+                metrics.template_time
+            )
+            self.histograms['db_queries'][view].observe(metrics.sql_count)
+            self.counters['cache_hits_total'][view] += metrics.cache_hits
+            self.counters['cache_misses_total'][view] += metrics.cache_misses
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus."""
+        lines = []
+        with self._lock:
+            for name, help_text, _ in self.HISTOGRAMS:
+                metric = f'{self.prefix}_{name}'
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                for view, histogram in sorted(self.histograms[name].items()):
+                    label = f'view="{view}"'
+                    for bound, count in zip(
+                        histogram.buckets, histogram.counts
+                    ):
+                        lines.append(
+                            f'{metric}_bucket{{{label},le="{bound}"}} {count}'
+                        )
+                    lines.append(
+                        f'{metric}_bucket{{{label},le="+Inf"}} '
+                        f'{histogram.total}'
+                    )
+                    lines.append(f'{metric}_sum{{{label}}} {histogram.sum}')
+                    lines.append(
+                        f'{metric}_count{{{label}}} {histogram.total}'
+                    )
+            for name, help_text in self.COUNTERS:
+                metric = f'{self.prefix}_{name}'
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} counter')
+                for view, value in sorted(self.counters[name].items()):
+                    lines.append(f'{metric}{{view="{view}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,63 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+from .db_router import read_from_replicas
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'pin_primary'
+
+
+class MetricsMiddleware:
+    """Замеряет SQL, шаблоны, кэш и общее время каждого запроса.
+
+    Итог отдаётся в заголовке Server-Timing и копится в гистограммах
+    по имени маршрута для /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        request_metrics.sql_wrapper
+                    ))
+                response = self.get_response(request)
+        finally:
+            metrics.finish()
+        total = request_metrics.elapsed
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.registry.observe(view, request_metrics, total)
+        response['Server-Timing'] = request_metrics.server_timing(total)
+        return response
+
+
+class ReplicaMiddleware:
+    """Отправляет чтение безопасных запросов на реплики.
+
+    После запроса, меняющего данные, посетитель на REPLICA_PIN_SECONDS
+    закрепляется за основной базой: cookie pin_primary гарантирует,
+    что он увидит свою запись, даже если реплика отстаёт.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        with read_from_replicas(safe and PIN_COOKIE not in request.COOKIES):
+            response = self.get_response(request)
+        if not safe and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,22 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core import holes
+
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **params):
+    """Часть страницы, зависящая от посетителя.
+
+    {% hole 'follow_button' author_id=author.pk %}
+    В странице для кэша на её месте остаётся метка, иначе фрагмент
+    отрисовывается сразу.
+    """
+    request = context['request']
+    params = {key: str(value) for key, value in params.items()}
+    if holes.punching(request):
+        return mark_safe(holes.marker(name, params))
+    return holes.render_hole(request, name, params)
@@ -0,0 +1,58 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core import holes
+from core.caching import fetch
+
+
+register = template.Library()
+
+
+class SWRCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, name, vary_on, version):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.name = name
+        self.vary_on = vary_on
+        self.version = version
+
+    def render(self, context):
+        key = make_template_fragment_key(
+            self.name, [var.resolve(context) for var in self.vary_on]
+        )
+        version = None
+        if self.version is not None:
+            version = self.version.resolve(context)
+        value, current = fetch(
+            key,
+            lambda: self.nodelist.render(context),
+            int(self.timeout.resolve(context)),
+            version=version,
+        )
+        if not current:
+            holes.mark_stale(context.get('request'))
+        return value
+
+
+@register.tag
+def swr_cache(parser, token):
+    """Как {% cache %}, но устаревший фрагмент пересчитывает один запрос.
+
+    {% swr_cache 300 index_page page_obj.cursor version=cache_generation %}
+    Фрагмент обновляется по таймауту или при смене version; пока его
+    пересчитывают, остальные запросы получают прежний.
+    """
+    nodelist = parser.parse(('endswr_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    version = None
+    if bits[-1].startswith('version='):
+        version = parser.compile_filter(bits.pop()[len('version='):])
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} требует таймаут и имя фрагмента'
+        )
+    return SWRCacheNode(
+        nodelist, parser.compile_filter(bits[1]), bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]], version
+    )
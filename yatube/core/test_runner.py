@@ -0,0 +1,28 @@
+"""Запуск тестов с отдельным файлом кэша.
+
+Тесты очищают кэш, поэтому на время прогона кэш переносится
+во временный каталог и не трогает файл работающего сайта.
+"""
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp(prefix='yatube-cache-')
+        self._cache_settings = override_settings(CACHES={
+            alias: {**options, 'LOCATION': f'{self._cache_dir}/{alias}'}
+            for alias, options in settings.CACHES.items()
+        })
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
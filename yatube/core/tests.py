@@ -0,0 +1,269 @@
+import multiprocessing
+import os
+import tempfile
+from http import HTTPStatus
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.template import Context, Template
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Post
+from .cache_backends import SQLiteCache
+from .caching import get_or_refresh
+from .metrics import registry
+from .middleware import PIN_COOKIE
+
+
+User = get_user_model()
+
+# Реплика объявлена в настройках при запуске тестов.
+REPLICA = 'test_replica'
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def test_server_timing_header(self):
+        response = self.client.get('/')
+        timing = response['Server-Timing']
+        for part in ('db;dur=', 'tpl;dur=', 'cache;desc=', 'total;dur='):
+            with self.subTest(part=part):
+                self.assertIn(part, timing)
+        template_ms = float(timing.split('tpl;dur=')[1].split(',')[0])
+        self.assertGreater(template_ms, 0)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint(self):
+        self.client.get('/')
+        self.client.get('/')
+        response = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        text = response.content.decode()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            text
+        )
+        self.assertIn('yatube_db_queries_bucket{view="posts:index"', text)
+        hits = [
+            line for line in text.splitlines()
+            if line.startswith('yatube_cache_hits_total{view="posts:index"}')
+        ]
+        self.assertNotEqual(hits[0].split()[-1], '0')
+
+    def test_metrics_require_token(self):
+        cases = (
+            ('secret', {}),
+            ('secret', {'HTTP_AUTHORIZATION': 'Bearer wrong'}),
+            ('secret', {'HTTP_AUTHORIZATION': 'Bearer сикрет'}),
+            ('', {'HTTP_AUTHORIZATION': 'Bearer '}),
+        )
+        for token, headers in cases:
+            with self.subTest(token=token, headers=headers):
+                with override_settings(METRICS_TOKEN=token):
+                    # Локальный адрес, как за прокси, токен не заменяет.
+                    response = self.client.get(
+                        '/metrics', REMOTE_ADDR='127.0.0.1', **headers
+                    )
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class ReplicaRouterTests(TransactionTestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='writer')
+        self.old_post = Post.objects.create(author=self.user, text='Старый')
+        self.replicate()
+        self.new_post = Post.objects.create(author=self.user, text='Новый')
+
+    def replicate(self):
+        """Копирует основную базу в реплику, как это сделала бы репликация."""
+        for alias in ('default', REPLICA):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(
+            connections[REPLICA].connection
+        )
+
+    def listed_ids(self):
+        response = self.client.get(reverse('api:index'))
+        return {post['id'] for post in response.json()['results']}
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.listed_ids(), {self.old_post.pk})
+
+    def test_writes_go_to_primary_and_pin_reader(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('posts:add_comment', args=[self.new_post.pk]),
+            {'text': 'Свой комментарий'}
+        )
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertTrue(Comment.objects.using('default').exists())
+        self.assertFalse(Comment.objects.using(REPLICA).exists())
+        # Закреплённый посетитель читает свою запись из основной базы.
+        self.assertEqual(
+            self.listed_ids(), {self.old_post.pk, self.new_post.pk}
+        )
+        del self.client.cookies[PIN_COOKIE]
+        self.assertEqual(self.listed_ids(), {self.old_post.pk})
+
+
+def _increment(location, times):
+    shared = SQLiteCache(location, {})
+    for _ in range(times):
+        shared.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(
+            self.location, {'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_EVERY': 1}}
+        )
+
+    def test_tests_do_not_use_site_cache(self):
+        location = settings.CACHES['default']['LOCATION']
+        self.assertTrue(location.startswith(tempfile.gettempdir()))
+        self.assertEqual(cache._path, location)
+
+    def test_shared_between_instances(self):
+        self.cache.set('page', {'html': '<p>'})
+        other = SQLiteCache(self.location, {})
+        self.assertEqual(other.get('page'), {'html': '<p>'})
+        other.delete('page')
+        self.assertIsNone(self.cache.get('page'))
+
+    def test_add_and_expiry(self):
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.cache.set('key', 3, timeout=-1)
+        self.assertFalse(self.cache.has_key('key'))
+        self.assertTrue(self.cache.add('key', 4))
+        self.assertEqual(self.cache.get('key'), 4)
+
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=_increment, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        self.assertEqual(self.cache.decr('counter', 10), 190)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_evicts_least_recently_used(self):
+        self.cache._touch_interval = 0
+        for key in 'abcd':
+            self.cache.set(key, key)
+        self.cache.get('a')
+        self.cache.set('e', 'e')
+        self.assertEqual(
+            self.cache.get_many('abcde'),
+            {'a': 'a', 'c': 'c', 'd': 'd', 'e': 'e'}
+        )
+
+    def test_culls_every_few_writes(self):
+        self.cache._cull_every = 3
+        with mock.patch.object(self.cache, '_cull') as cull:
+            for key in 'abcde':
+                self.cache.set(key, key)
+            self.assertEqual(cull.call_count, 1)
+            self.cache.set_many({'f': 'f', 'g': 'g'})
+        self.assertEqual(cull.call_count, 2)
+
+    def test_requires_upsert_support(self):
+        with mock.patch('sqlite3.sqlite_version_info', (3, 22, 0)):
+            with self.assertRaises(ImproperlyConfigured):
+                SQLiteCache(self.location, {})
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_stale_value_while_locked(self):
+        self.assertEqual(get_or_refresh('key', self.compute, 60, 'v1'), 1)
+        self.assertEqual(get_or_refresh('key', self.compute, 60, 'v1'), 1)
+        # Пока другой запрос держит блокировку, отдаётся прежнее значение.
+        cache.add('lock:key', 1)
+        self.assertEqual(get_or_refresh('key', self.compute, 60, 'v2'), 1)
+        cache.delete('lock:key')
+        self.assertEqual(get_or_refresh('key', self.compute, 60, 'v2'), 2)
+        self.assertEqual(self.calls, 2)
+
+    def test_early_refresh_before_expiry(self):
+        get_or_refresh('key', self.compute, 60)
+        value, version, _, expires = cache.get('key')
+        with mock.patch('core.caching.random.random', return_value=0.5):
+            self.assertEqual(get_or_refresh('key', self.compute, 60), 1)
+            # Долгий пересчёт: XFetch обновляет значение заранее.
+            cache.set('key', (value, version, 3600, expires))
+            self.assertEqual(get_or_refresh('key', self.compute, 60), 2)
+
+    def test_template_tag(self):
+        source = Template(
+            '{% load swr_cache %}'
+            '{% swr_cache 60 fragment name version=version %}'
+            '{{ name }}-{{ version }}{% endswr_cache %}'
+        )
+        self.assertEqual(source.render(Context(
+            {'name': 'a', 'version': 1}
+        )), 'a-1')
+        cache.add(f'lock:{make_template_fragment_key("fragment", ["a"])}', 1)
+        self.assertEqual(source.render(Context(
+            {'name': 'a', 'version': 2}
+        )), 'a-1')
+
+
+@skipUnless(
+    connections['default'].settings_dict['ENGINE']
+    == 'core.db.backends.sqlite3',
+    'нужен профиль SQLITE_PROFILE=concurrent'
+)
+class SqliteBackendTests(TransactionTestCase):
+
+    def test_init_commands_applied(self):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 15000)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_atomic_begins_immediate(self):
+        connection = connections['default']
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                User.objects.create_user(username='writer')
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
@@ -1,6 +1,10 @@
+import hmac
 from http import HTTPStatus
 
-from django.shortcuts import render
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+from .metrics import registry, render
 
 
 def page_not_found(request, exception):
@@ -26,3 +30,21 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """Метрики в формате Prometheus; доступны только с METRICS_TOKEN.
+
+    Адрес клиента не проверяется: за прокси на той же машине
+    он всегда локальный.
+    """
+    token = settings.METRICS_TOKEN
+    if not token or not hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(),
+        f'Bearer {token}'.encode()
+    ):
+        raise Http404
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
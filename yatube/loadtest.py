@@ -0,0 +1,257 @@
+"""Нагрузочный тест представлений posts на локальном WSGI-сервере.
+
+Данные готовит команда generate_data:
+
+    python manage.py generate_data --posts 100000
+    python loadtest.py --concurrency 16 --requests 200
+
+Для каждого представления печатает пропускную способность, перцентили
+задержки p50/p95/p99 и среднее число SQL-запросов на запрос.
+"""
+import argparse
+import os
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import django
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+QUERIES_HEADER = 'X-Queries'
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def counting_app(application):
+    """WSGI-обёртка, отдающая число SQL-запросов в заголовке ответа."""
+    from django.db import connection
+
+    def app(environ, start_response):
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        def start(status, headers, exc_info=None):
+            headers.append((QUERIES_HEADER, str(len(queries))))
+            return start_response(status, headers, exc_info)
+
+        with connection.execute_wrapper(count):
+            return application(environ, start)
+
+    return app
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(share * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def session_cookies(user):
+    """Cookie авторизованной сессии пользователя и CSRF-токен."""
+    from django.conf import settings
+    from django.middleware.csrf import _get_new_csrf_token
+    from django.test import Client
+
+    client = Client()
+    client.force_login(user)
+    csrf_token = _get_new_csrf_token()
+    cookie = '; '.join((
+        f'{settings.SESSION_COOKIE_NAME}='
+        f'{client.cookies[settings.SESSION_COOKIE_NAME].value}',
+        f'{settings.CSRF_COOKIE_NAME}={csrf_token}',
+    ))
+    return {'Cookie': cookie, 'X-CSRFToken': csrf_token}
+
+
+def build_targets(prefix):
+    """Запросы для каждого представления posts/views.py."""
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+
+    from posts.models import AuthorStats, Group, Post
+
+    user_model = get_user_model()
+    reader = user_model.objects.filter(
+        username__startswith=f'{prefix}_user_'
+    ).order_by('-stats__following_count').first()
+    if reader is None:
+        raise SystemExit(
+            'Нет данных: сначала выполните manage.py generate_data.'
+        )
+    author = user_model.objects.get(pk=AuthorStats.objects.order_by(
+        '-posts_count'
+    ).values_list('user_id', flat=True).first())
+    group = Group.objects.filter(slug__startswith=f'{prefix}-group-').first()
+    own_post = Post.objects.filter(author=reader).first()
+    post = Post.objects.order_by('-comments_count').first()
+    authors = list(
+        user_model.objects.filter(username__startswith=f'{prefix}_user_')
+        .exclude(pk=reader.pk).values_list('username', flat=True)[:100]
+    )
+
+    def follow_url():
+        return reverse('posts:profile_follow', args=[random.choice(authors)])
+
+    def unfollow_url():
+        return reverse(
+            'posts:profile_unfollow', args=[random.choice(authors)]
+        )
+
+    targets = {
+        'index': (lambda: reverse('posts:index'), None),
+        'group_posts': (
+            lambda: reverse('posts:group_list', args=[group.slug]), None
+        ),
+        'profile': (
+            lambda: reverse('posts:profile', args=[author.username]), None
+        ),
+        'post_detail': (
+            lambda: reverse('posts:post_detail', args=[post.pk]), None
+        ),
+        'post_search': (
+            lambda: reverse('posts:search') + '?' + urllib.parse.urlencode(
+                {'q': random.choice(('кофе', 'утро город', 'море'))}
+            ),
+            None
+        ),
+        'follow_index': (lambda: reverse('posts:follow_index'), None),
+        'post_create': (lambda: reverse('posts:post_create'), None),
+        'post_create:submit': (
+            lambda: reverse('posts:post_create'),
+            {'text': 'Пост нагрузочного теста'}
+        ),
+        'add_comment': (
+            lambda: reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'Комментарий нагрузочного теста'}
+        ),
+        'profile_follow': (follow_url, None),
+        'profile_unfollow': (unfollow_url, None),
+    }
+    if own_post is not None:
+        targets['post_edit'] = (
+            lambda: reverse('posts:post_edit', args=[own_post.pk]), None
+        )
+    return targets, session_cookies(reader)
+
+
+def hit(base_url, url, form, headers, opener):
+    data = urllib.parse.urlencode(form).encode() if form else None
+    request = urllib.request.Request(base_url + url, data, headers)
+    started = time.perf_counter()
+    try:
+        response = opener.open(request)
+    except urllib.error.HTTPError as error:
+        # Редиректы после записи приходят сюда как HTTPError.
+        response = error
+    response.read()
+    elapsed = time.perf_counter() - started
+    return response.status, elapsed, int(response.headers[QUERIES_HEADER])
+
+
+def run_view(base_url, name, target, headers, args):
+    make_url, form = target
+    opener = urllib.request.build_opener(NoRedirect)
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for _ in range(args.warmup):
+            hit(base_url, make_url(), form, headers, opener)
+        started = time.perf_counter()
+        results = list(pool.map(
+            lambda _: hit(base_url, make_url(), form, headers, opener),
+            range(args.requests)
+        ))
+        wall = time.perf_counter() - started
+    errors = sum(status >= 400 for status, _, _ in results)
+    latencies = [elapsed * 1000 for _, elapsed, _ in results]
+    return {
+        'view': name,
+        'rps': len(results) / wall,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'queries': statistics.mean(queries for _, _, queries in results),
+        'errors': errors,
+    }
+
+
+def report(rows):
+    header = (
+        f'{"view":<20}{"rps":>9}{"p50, мс":>10}{"p95, мс":>10}'
+        f'{"p99, мс":>10}{"SQL":>7}{"ошибки":>8}'
+    )
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        print(
+            f'{row["view"]:<20}{row["rps"]:>9.1f}{row["p50"]:>10.1f}'
+            f'{row["p95"]:>10.1f}{row["p99"]:>10.1f}{row["queries"]:>7.1f}'
+            f'{row["errors"]:>8}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument(
+        '--requests', type=int, default=200,
+        help='Число замеряемых запросов на представление.'
+    )
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--prefix', default='bench')
+    parser.add_argument(
+        '--views', nargs='*',
+        help='Ограничить прогон этими представлениями.'
+    )
+    args = parser.parse_args()
+
+    django.setup()
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+
+    # В режиме отладки Django копит тексты запросов и отдаёт подробные
+    # страницы ошибок — это искажает замеры.
+    settings.DEBUG = False
+    targets, headers = build_targets(args.prefix)
+    server = make_server(
+        '127.0.0.1', 0, counting_app(get_wsgi_application()),
+        server_class=ThreadingWSGIServer, handler_class=QuietHandler
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        rows = [
+            run_view(base_url, name, target, headers, args)
+            for name, target in targets.items()
+            if not args.views or name in args.views
+        ]
+    finally:
+        server.shutdown()
+    report(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Версии страниц для условных GET-запросов.
+
+ETag складывается из версии страницы — поколений кэша, от которых она
+зависит, — и из данных посетителя для её «дырок» (пользователь, его
+подписки, CSRF-токен для форм). Версия общая для всех посетителей
+и служит ключом кэша целой страницы (core.holes). Last-Modified
+не отдаётся: правка, удаление записи или переименование автора
+не меняют ни одной даты страницы, и по If-Modified-Since браузер
+получал бы устаревшую копию.
+"""
+import hashlib
+
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from . import generations
+from .models import Group, Post, User
+
+
+def _visitor(request):
+    if not request.user.is_authenticated:
+        return (0,)
+    # Формы на страницах только для вошедших; get_token сразу выдаёт
+    # CSRF-cookie, иначе её выставила бы первая отрисовка и ETag
+    # сменился бы на следующем запросе.
+    get_token(request)
+    return (
+        request.user.pk, request.META['CSRF_COOKIE'],
+        # Кнопка «Подписаться/Отписаться» зависит от подписок посетителя.
+        generations.get_generation(
+            generations.following_ns(request.user.pk)
+        ),
+    )
+
+
+def _etag(*parts):
+    return hashlib.md5(
+        '|'.join(map(str, parts)).encode()
+    ).hexdigest()
+
+
+def post_stamp(request, post_id):
+    post = (
+        Post.objects.select_related('author__stats', 'group')
+        .filter(pk=post_id)
+        .first()
+    )
+    if post is None:
+        return None
+    namespaces = [
+        generations.post_ns(post.pk), generations.author_ns(post.author_id)
+    ]
+    if post.group_id is not None:
+        namespaces.append(generations.group_ns(post.group_id))
+    version = f'post|{generations.get_generation(*namespaces)}'
+    return post, version
+
+
+def profile_stamp(request, username):
+    author = (
+        User.objects.select_related('stats')
+        .filter(username=username)
+        .first()
+    )
+    if author is None:
+        return None
+    version = 'profile|' + generations.get_generation(
+        generations.author_ns(author.pk), generations.GROUPS
+    )
+    return author, version
+
+
+def group_stamp(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return None
+    version = 'group|' + generations.get_generation(
+        generations.group_ns(group.pk)
+    )
+    return group, version
+
+
+def page_object(request):
+    """Объект страницы, загруженный вместе с её версией, или None."""
+    return getattr(request, '_page_stamp', (None,))[0]
+
+
+def page_version(request, **kwargs):
+    """Версия страницы для кэша целой страницы."""
+    return getattr(request, '_page_stamp', (None, None))[1]
+
+
+def index_version(request):
+    return 'index|' + generations.get_generation(
+        generations.POSTS, generations.GROUPS
+    )
+
+
+def conditional_page(stamp):
+    """Отвечает 304 Not Modified, если версия страницы не изменилась.
+
+    stamp(request, **kwargs) возвращает (объект, версия) или None,
+    если объекта нет. Он вычисляется один раз на запрос,
+    а представление берёт объект через page_object, не запрашивая его
+    повторно.
+    """
+    def get_stamp(request, **kwargs):
+        if not hasattr(request, '_page_stamp'):
+            request._page_stamp = (
+                stamp(request, **kwargs) or (None, None)
+            )
+        return request._page_stamp
+
+    def etag(request, **kwargs):
+        version = get_stamp(request, **kwargs)[1]
+        if version is None:
+            return None
+        return _etag(version, *_visitor(request))
+
+    def decorator(view):
+        view = condition(etag_func=etag)(view)
+        # Страница зависит от посетителя и должна перепроверяться
+        # при каждом показе.
+        return cache_control(private=True, no_cache=True)(view)
+
+    return decorator
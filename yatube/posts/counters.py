@@ -0,0 +1,63 @@
+"""Инкрементальное обновление денормализованных счётчиков."""
+from django.db.models import Count, F
+
+from .models import AuthorStats, Follow, Post
+
+
+USER_FIELDS = ('posts_count', 'followers_count', 'following_count')
+BATCH_SIZE = 1000
+
+
+def count_for_users(user_ids):
+    """Точные значения счётчиков для списка пользователей."""
+    counts = {
+        user_id: dict.fromkeys(USER_FIELDS, 0) for user_id in user_ids
+    }
+    sources = (
+        ('posts_count', Post.objects, 'author_id'),
+        ('followers_count', Follow.objects, 'author_id'),
+        ('following_count', Follow.objects, 'user_id'),
+    )
+    for field, manager, key in sources:
+        rows = (
+            manager.filter(**{f'{key}__in': user_ids})
+            .values(key)
+            .annotate(total=Count('pk'))
+            .values_list(key, 'total')
+            .order_by()
+        )
+        for user_id, total in rows:
+            counts[user_id][field] = total
+    return counts
+
+
+def get_stats(user):
+    """Счётчики пользователя; создаёт их пересчётом, если записи нет."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        stats, _ = AuthorStats.objects.get_or_create(
+            user=user, defaults=count_for_users([user.pk])[user.pk]
+        )
+        return stats
+
+
+def bump_user(user_id, field, delta):
+    # Условие не даёт уйти в минус, если счётчик уже разошёлся с данными.
+    updated = AuthorStats.objects.filter(
+        user_id=user_id, **{f'{field}__gte': -delta}
+    ).update(**{field: F(field) + delta})
+    if not updated and delta > 0:
+        # Записи ещё нет: создаём её по точному пересчёту,
+        # который уже учитывает текущее изменение. При уменьшении
+        # запись не создаём: это может быть каскадное удаление
+        # пользователя, а расхождение исправит reconcile_counters.
+        AuthorStats.objects.get_or_create(
+            user_id=user_id, defaults=count_for_users([user_id])[user_id]
+        )
+
+
+def bump_comments(post_id, delta):
+    Post.objects.filter(pk=post_id, comments_count__gte=-delta).update(
+        comments_count=F('comments_count') + delta
+    )
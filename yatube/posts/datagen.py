@@ -0,0 +1,164 @@
+"""Генератор синтетических данных для бенчмарков.
+
+Пишет пачками через bulk_create, поэтому сигналы не срабатывают:
+ленты подписок заполняются одним INSERT ... SELECT, а счётчики
+пересчитываются командой reconcile_counters.
+"""
+import random
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count, F
+
+from .models import (AuthorStats, Comment, Follow, Group, Post, StoredFile,
+                     TimelineEntry)
+from .timeline import FANOUT_LIMIT
+
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+WORDS = (
+    'дневник', 'утро', 'кофе', 'город', 'книга', 'прогулка', 'работа',
+    'музыка', 'кошка', 'дождь', 'море', 'поезд', 'друзья', 'кино', 'лес',
+)
+
+
+def _text(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _insert(model, objects):
+    # Django 2.2 не ограничивает явный batch_size лимитами SQLite.
+    fields = model._meta.concrete_fields
+    batch_size = min(
+        BATCH_SIZE, connection.ops.bulk_batch_size(fields, objects) or 1
+    )
+    model.objects.bulk_create(objects, batch_size=batch_size)
+
+
+def _ids(model, filters):
+    return list(
+        model.objects.filter(**filters).order_by('pk').values_list(
+            'pk', flat=True
+        )
+    )
+
+
+def seed(users=100, groups=10, posts=10000, comments=20000,
+         follows_per_user=20, prefix='bench', images=(), seed_value=0,
+         log=None):
+    """Создаёт пользователей, группы, посты, комментарии и подписки.
+
+    images — имена уже сохранённых файлов картинок; каждый второй пост
+    получает одну из них.
+    """
+    rng = random.Random(seed_value)
+    log = log or (lambda message: None)
+
+    _insert(User, [
+        User(
+            username=f'{prefix}_user_{i}',
+            first_name='Автор',
+            last_name=str(i)
+        )
+        for i in range(users)
+    ])
+    _insert(Group, [
+        Group(title=f'Группа {i}', slug=f'{prefix}-group-{i}', description='-')
+        for i in range(groups)
+    ])
+    user_ids = _ids(User, {'username__startswith': f'{prefix}_user_'})
+    group_ids = _ids(Group, {'slug__startswith': f'{prefix}-group-'})
+    log(f'Пользователей: {len(user_ids)}, групп: {len(group_ids)}')
+
+    follows = set()
+    for user_id in user_ids:
+        for author_id in rng.sample(
+            user_ids, min(follows_per_user, len(user_ids))
+        ):
+            if author_id != user_id:
+                follows.add((user_id, author_id))
+    _insert(Follow, [
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id, author_id in follows
+    ])
+    log(f'Подписок: {len(follows)}')
+
+    group_choices = group_ids + [None]
+    last_pk = Post.objects.order_by('pk').values_list('pk', flat=True).last()
+    created_comments = 0
+    for start in range(0, posts, BATCH_SIZE):
+        stop = min(start + BATCH_SIZE, posts)
+        with transaction.atomic():
+            _insert(Post, [
+                Post(
+                    author_id=rng.choice(user_ids),
+                    group_id=rng.choice(group_choices),
+                    text=_text(rng),
+                    image=rng.choice(images) if images and i % 2 else '',
+                )
+                for i in range(start, stop)
+            ])
+            # Комментарии распределяются по постам текущей пачки.
+            post_ids = _ids(Post, {'pk__gt': last_pk or 0})
+            last_pk = post_ids[-1]
+            batch_comments = comments * stop // posts - created_comments
+            _insert(Comment, [
+                Comment(
+                    post_id=rng.choice(post_ids),
+                    author_id=rng.choice(user_ids),
+                    text=_text(rng, 6),
+                )
+                for _ in range(batch_comments)
+            ])
+            created_comments += batch_comments
+        log(f'Постов: {stop}, комментариев: {created_comments}')
+
+    count_image_refs(images)
+    # Ленты заполняются после счётчиков: посты "тяжёлых" авторов
+    # в них не копируются.
+    call_command('reconcile_counters', stdout=StringIO())
+    AuthorStats.objects.filter(followers_count__gte=FANOUT_LIMIT).update(
+        heavy=True
+    )
+    fill_timelines(user_ids)
+    log('Ленты подписок и счётчики заполнены')
+
+
+def count_image_refs(images):
+    """Добавляет созданные посты к счётчикам ссылок на картинки."""
+    refs = (
+        Post.objects.filter(image__in=images)
+        .values_list('image')
+        .annotate(total=Count('pk'))
+        .order_by()
+    )
+    for name, total in refs:
+        updated = StoredFile.objects.filter(name=name).update(
+            refs=F('refs') + total
+        )
+        if not updated:
+            StoredFile.objects.create(name=name, refs=total)
+
+
+def fill_timelines(user_ids):
+    timeline = TimelineEntry._meta.db_table
+    follow = Follow._meta.db_table
+    post = Post._meta.db_table
+    stats = AuthorStats._meta.db_table
+    with connection.cursor() as cursor:
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f'INSERT INTO {timeline} (user_id, post_id, created) '
+                f'SELECT f.user_id, p.id, p.created FROM {follow} f '
+                f'JOIN {post} p ON p.author_id = f.author_id '
+                f'WHERE f.user_id IN ({placeholders}) '
+                f'AND f.author_id NOT IN (SELECT user_id FROM {stats} '
+                f'WHERE heavy)',
+                chunk
+            )
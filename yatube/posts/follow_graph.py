@@ -0,0 +1,56 @@
+"""Граф подписок в кэше.
+
+Для каждого пользователя хранится отсортированный массив id авторов,
+на которых он подписан (array 'q', 8 байт на подписку), вместе с
+поколением following_ns, при котором массив построен. Подписка
+и отписка сдвигают поколение, и устаревший массив перестраивается
+одним запросом.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from . import generations
+from .models import Follow
+
+
+def cached_ids(key, namespace, build, timeout=None):
+    """Отсортированный массив id из кэша, действительный для поколения."""
+    generation = generations.get_generation(namespace)
+    entry = cache.get(key)
+    ids = array('q')
+    if entry is not None and entry[0] == generation:
+        ids.frombytes(entry[1])
+        return ids
+    ids.extend(sorted(build()))
+    cache.set(key, (generation, ids.tobytes()), timeout)
+    return ids
+
+
+def contains(ids, value):
+    index = bisect_left(ids, value)
+    return index < len(ids) and ids[index] == value
+
+
+def following_ids(user_id):
+    """Отсортированный массив id авторов, на которых подписан user_id."""
+    return cached_ids(
+        f'follow_graph:{user_id}',
+        generations.following_ns(user_id),
+        lambda: Follow.objects.filter(user_id=user_id).values_list(
+            'author_id', flat=True
+        ),
+    )
+
+
+def is_following(user_id, author_id):
+    return contains(following_ids(user_id), author_id)
+
+
+def refresh(user_id):
+    """Заново строит массив после фиксации подписки или отписки.
+
+    Вызывается после bump_on_commit, когда поколение уже сдвинуто.
+    """
+    following_ids(user_id)
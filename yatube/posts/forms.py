@@ -1,12 +1,54 @@
 from django import forms
 
-from .models import Post, Comment
+from . import resumable, uploads
+from .models import Post, Comment, UploadSession
+
+
+class ImageUploadField(forms.ImageField):
+    """Поле картинки, которое не декодирует её в процессе запроса."""
+
+    def to_python(self, data):
+        if isinstance(data, uploads.RejectedUpload):
+            raise forms.ValidationError(data.reason)
+        # FileField.to_python: проверка имени и размера без Pillow.
+        file = super(forms.ImageField, self).to_python(data)
+        return None if file is None else uploads.process(file)
 
 
 class PostForm(forms.ModelForm):
+    # Токен завершённой загрузки по частям (posts.resumable) вместо файла.
+    upload = forms.UUIDField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, user=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = user
+        self.upload_session = None
+
+    def clean(self):
+        cleaned_data = super().clean()
+        token = cleaned_data.get('upload')
+        if token:
+            self.upload_session = resumable.completed(self.user, token)
+            if self.upload_session is None:
+                self.add_error(
+                    'upload', 'Загрузка не найдена или ещё не завершена.'
+                )
+            else:
+                # Файл уже в хранилище: пост ссылается на него по имени.
+                cleaned_data['image'] = self.upload_session.name
+        return cleaned_data
+
+    def consume_upload(self):
+        """Закрывает сессию загрузки, файл которой достался посту."""
+        if self.upload_session is not None:
+            UploadSession.objects.filter(
+                pk=self.upload_session.pk
+            ).delete()
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
+        field_classes = {'image': ImageUploadField}
         widgets = {
             "text": forms.Textarea(attrs={
                 'class': 'form-control',
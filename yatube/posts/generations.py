@@ -0,0 +1,46 @@
+"""Пространства имён поколений кэша для страниц с постами."""
+from django.db import transaction
+
+from core.caching import bump, get_generation  # noqa: F401
+
+
+POSTS = 'posts'
+GROUPS = 'groups'
+# Авторы с FANOUT_LIMIT подписчиков и больше.
+HEAVY_AUTHORS = 'heavy_authors'
+
+
+def group_ns(group_id):
+    return f'group:{group_id}'
+
+
+def author_ns(author_id):
+    return f'author:{author_id}'
+
+
+def post_ns(post_id):
+    return f'post:{post_id}'
+
+
+def following_ns(user_id):
+    return f'following:{user_id}'
+
+
+def bump_on_commit(*namespaces):
+    """Сдвигает поколения сразу и ещё раз после фиксации транзакции.
+
+    Сигналы срабатывают внутри транзакции записи: параллельный запрос
+    может успеть собрать страницу из старых данных и сохранить её
+    под уже сдвинутым поколением. Повторный сдвиг после фиксации
+    делает такую запись недействительной.
+    """
+    bump(*namespaces)
+    transaction.on_commit(lambda: bump(*namespaces))
+
+
+def bump_post(post, old_group_id=None):
+    namespaces = {POSTS, author_ns(post.author_id), post_ns(post.pk)}
+    for group_id in (post.group_id, old_group_id):
+        if group_id is not None:
+            namespaces.add(group_ns(group_id))
+    bump_on_commit(*namespaces)
@@ -0,0 +1,36 @@
+"""Части страниц posts, зависящие от посетителя."""
+from core.holes import register
+
+from . import follow_graph
+from .forms import CommentForm
+
+
+@register('switcher', 'posts/includes/switcher.html')
+def switcher(request, active=''):
+    return {'index': active == 'index', 'follow': active == 'follow'}
+
+
+@register('follow_button', 'posts/includes/follow_button.html')
+def follow_button(request, author_id, username):
+    user = request.user
+    show = user.is_authenticated and user.pk != int(author_id)
+    return {
+        'show': show,
+        'username': username,
+        'following': show and follow_graph.is_following(
+            user.pk, int(author_id)
+        ),
+    }
+
+
+@register('post_edit_link', 'posts/includes/post_edit_link.html')
+def post_edit_link(request, post_id, author_id):
+    return {
+        'post_id': post_id,
+        'is_author': request.user.pk == int(author_id),
+    }
+
+
+@register('comment_form', 'posts/includes/comment_form.html')
+def comment_form(request, post_id):
+    return {'post_id': post_id, 'form': CommentForm()}
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import resumable
+
+
+class Command(BaseCommand):
+    help = 'Удаляет брошенные сессии загрузки картинок по частям.'
+
+    def handle(self, *args, **options):
+        count = resumable.clear_expired()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено сессий загрузки: {count}.'
+        ))
@@ -0,0 +1,123 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts import datagen, timeline
+from posts.models import AuthorStats, Comment, Follow, Group, Post
+from posts.views import POSTS_CUT
+
+
+INDEXED_MODELS = (Post, Comment, Follow)
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с удалёнными индексами."""
+
+
+def hot_queries():
+    """Запросы, повторяющие выборки из posts/views.py и posts/timeline.py."""
+    author_id = AuthorStats.objects.order_by('-posts_count').values_list(
+        'user_id', flat=True
+    ).first()
+    reader_id = AuthorStats.objects.order_by('-following_count').values_list(
+        'user_id', flat=True
+    ).first()
+    group = Group.objects.order_by('pk').first()
+    post_id = Post.objects.order_by('-comments_count').values_list(
+        'pk', flat=True
+    ).first()
+    # Порядок как у CursorPaginator: индекс по created с неявным rowid
+    # в конце читается в обе стороны без сортировки.
+    posts = Post.objects.select_related('author', 'group').order_by(
+        '-created', '-pk'
+    )
+    return (
+        ('Главная', posts[:POSTS_CUT]),
+        ('Группа', posts.filter(group=group)[:POSTS_CUT]),
+        ('Профиль', posts.filter(author_id=author_id)[:POSTS_CUT]),
+        ('Комментарии', Comment.objects.filter(
+            post_id=post_id
+        ).select_related('author').order_by('created', 'pk')),
+        ('Подписчики автора', Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)),
+        ('Лента подписок', timeline.entry_keys(reader_id)[:POSTS_CUT]),
+        ('Посты тяжёлого автора', timeline.author_keys(
+            author_id
+        )[:POSTS_CUT]),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Печатает планы и время горячих запросов без составных индексов '
+        'и с ними.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', action='store_true',
+            help='Сначала заполнить базу синтетическими данными.'
+        )
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows-per-user', type=int, default=30)
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнять каждый запрос при замере.'
+        )
+
+    def handle(self, *args, seed, repeat, **options):
+        if seed:
+            datagen.seed(
+                users=options['users'],
+                groups=options['groups'],
+                posts=options['posts'],
+                comments=options['comments'],
+                follows_per_user=options['follows_per_user'],
+                log=self.stdout.write,
+            )
+        try:
+            with transaction.atomic():
+                self.drop_indexes()
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    'Без составных индексов'
+                ))
+                before = self.run_queries(repeat)
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(self.style.MIGRATE_HEADING('С составными индексами'))
+        after = self.run_queries(repeat)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Итого, мс'))
+        for label, old in before.items():
+            self.stdout.write(
+                f'{label}: {old:.3f} -> {after[label]:.3f}'
+            )
+
+    def drop_indexes(self):
+        # DDL в SQLite и PostgreSQL транзакционен: индексы вернутся
+        # при откате.
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(
+                        f'DROP INDEX {connection.ops.quote_name(index.name)}'
+                    )
+
+    def run_queries(self, repeat):
+        timings = {}
+        for label, queryset in hot_queries():
+            self.stdout.write(f'{label}:')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'  {line}')
+            list(queryset.all())
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            timings[label] = (time.perf_counter() - started) * 1000 / repeat
+        return timings
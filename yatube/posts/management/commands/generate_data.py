@@ -0,0 +1,69 @@
+import random
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from posts import datagen, thumbnails
+from posts.models import Post
+
+
+def make_images(count, seed_value):
+    """Сохраняет count разноцветных картинок и возвращает их имена."""
+    rng = random.Random(seed_value)
+    storage = Post._meta.get_field('image').storage
+    names = []
+    for i in range(count):
+        buffer = BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (1280, 720), color).save(buffer, 'JPEG')
+        names.append(storage.save(
+            f'posts/bench_{i}.jpg', ContentFile(buffer.getvalue())
+        ))
+    return names
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами '
+        'с картинками, комментариями и подписками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument(
+            '--posts', type=int, default=100000,
+            help='Число постов, вплоть до десятков миллионов.'
+        )
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows-per-user', type=int, default=30)
+        parser.add_argument(
+            '--images', type=int, default=10,
+            help='Сколько разных картинок раздать постам; 0 — без картинок.'
+        )
+        parser.add_argument(
+            '--prefix', default='bench',
+            help='Префикс имён пользователей и слагов групп.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        images = make_images(options['images'], options['seed'])
+        # Миниатюры строятся сразу, чтобы нагрузочный тест не упирался
+        # в заглушки и фоновую обработку.
+        for name in images:
+            thumbnails.generate(name)
+        datagen.seed(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows_per_user=options['follows_per_user'],
+            prefix=options['prefix'],
+            images=images,
+            seed_value=options['seed'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS('Данные созданы.'))
@@ -0,0 +1,58 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import generations
+from posts.models import Post
+from posts.storage import CAS_NAME, acquire, release
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов из плоского каталога posts/ '
+        'в контентно-адресуемое хранилище пачками.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=200,
+            help='Сколько постов переносить за одну транзакцию.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        storage = Post._meta.get_field('image').storage
+        moved = missing = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .exclude(image='')
+                .order_by('pk')
+                .values_list('pk', 'image', 'author_id', 'group_id')
+                [:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            with transaction.atomic():
+                for pk, name, author_id, group_id in batch:
+                    if CAS_NAME.match(name):
+                        continue
+                    if not storage.exists(name):
+                        missing += 1
+                        self.stderr.write(f'Нет файла {name} у поста {pk}')
+                        continue
+                    with storage.open(name) as source:
+                        new_name = storage.save(name, File(source))
+                    # update() не вызывает сигналы: ссылки считаем сами.
+                    Post.objects.filter(pk=pk).update(image=new_name)
+                    acquire(new_name)
+                    release(name, storage)
+                    generations.bump_post(
+                        Post(pk=pk, author_id=author_id, group_id=group_id)
+                    )
+                    moved += 1
+            self.stdout.write(f'Обработаны посты до id={last_pk}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено картинок: {moved}, не найдено файлов: {missing}.'
+        ))
@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.counters import BATCH_SIZE, USER_FIELDS, count_for_users
+from posts.models import AuthorStats, Post
+
+
+User = get_user_model()
+
+
+def batches(queryset, size):
+    """Делит упорядоченный по pk queryset значений pk на пачки."""
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1]
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики пользователей и постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько строк пересчитывать за одну транзакцию.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        users = self.reconcile_users(batch_size)
+        posts = self.reconcile_posts(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: пользователей {users}, постов {posts}.'
+        ))
+
+    def reconcile_users(self, batch_size):
+        fixed = 0
+        user_ids = User.objects.order_by('pk').values_list('pk', flat=True)
+        for batch in batches(user_ids, batch_size):
+            counts = count_for_users(batch)
+            with transaction.atomic():
+                existing = AuthorStats.objects.select_for_update().in_bulk(
+                    batch
+                )
+                changed = []
+                for user_id, values in counts.items():
+                    stats = existing.get(user_id)
+                    if stats is None:
+                        AuthorStats.objects.create(user_id=user_id, **values)
+                        fixed += 1
+                        continue
+                    if any(
+                        getattr(stats, field) != values[field]
+                        for field in USER_FIELDS
+                    ):
+                        for field in USER_FIELDS:
+                            setattr(stats, field, values[field])
+                        changed.append(stats)
+                AuthorStats.objects.bulk_update(changed, USER_FIELDS)
+                fixed += len(changed)
+        return fixed
+
+    def reconcile_posts(self, batch_size):
+        fixed = 0
+        post_ids = Post.objects.order_by('pk').values_list('pk', flat=True)
+        for batch in batches(post_ids, batch_size):
+            with transaction.atomic():
+                changed = []
+                posts = (
+                    Post.objects.filter(pk__in=batch)
+                    .annotate(actual=Count('comments'))
+                    .only('pk', 'comments_count')
+                )
+                for post in posts:
+                    if post.comments_count != post.actual:
+                        post.comments_count = post.actual
+                        changed.append(post)
+                Post.objects.bulk_update(changed, ['comments_count'])
+                fixed += len(changed)
+        return fixed
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:46
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+
+    def count(queryset, key):
+        return Subquery(
+            queryset.filter(**{key: OuterRef('pk')})
+            .values(key)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+
+    users = User.objects.annotate(
+        posts_total=count(Post.objects, 'author'),
+        followers_total=count(Follow.objects, 'author'),
+        following_total=count(Follow.objects, 'user'),
+    )
+    AuthorStats.objects.bulk_create(
+        [
+            AuthorStats(
+                user_id=user.pk,
+                posts_count=user.posts_total or 0,
+                followers_count=user.followers_total or 0,
+                following_count=user.following_total or 0,
+            )
+            for user in users.iterator()
+        ],
+        batch_size=500,
+    )
+    for post in Post.objects.annotate(total=Count('comments')).filter(
+        total__gt=0
+    ).iterator():
+        Post.objects.filter(pk=post.pk).update(comments_count=post.total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0017_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
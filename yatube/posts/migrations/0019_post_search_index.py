@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from posts.search import install
+
+    install(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from posts.search import FTS_TABLE, TRIGGERS
+
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_author_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.19 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedfile',
+            name='variants',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
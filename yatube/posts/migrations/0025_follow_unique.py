@@ -0,0 +1,44 @@
+# Generated by Django 2.2.19 on 2026-10-18 21:14
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    duplicates = (
+        Follow.objects.values('user_id', 'author_id')
+        .annotate(keep=Min('pk'), total=Count('pk'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for row in duplicates.iterator():
+        extra = row['total'] - 1
+        Follow.objects.filter(
+            user_id=row['user_id'], author_id=row['author_id']
+        ).exclude(pk=row['keep']).delete()
+        # Счётчики из 0018 посчитаны вместе с повторами.
+        AuthorStats.objects.filter(
+            user_id=row['author_id'], followers_count__gte=extra
+        ).update(followers_count=F('followers_count') - extra)
+        AuthorStats.objects.filter(
+            user_id=row['user_id'], following_count__gte=extra
+        ).update(following_count=F('following_count') - extra)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0024_timeline_entry_key_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_follows, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_booking'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.19 on 2026-10-18 21:15
+
+from django.db import migrations, models
+
+
+# posts.timeline.FANOUT_LIMIT на момент миграции.
+FANOUT_LIMIT = 1000
+
+
+def mark_heavy_authors(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    AuthorStats.objects.filter(followers_count__gte=FANOUT_LIMIT).update(
+        heavy=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0025_follow_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='heavy',
+            field=models.BooleanField(default=False, verbose_name='Тяжёлый автор'),
+        ),
+        migrations.RunPython(mark_heavy_authors, migrations.RunPython.noop),
+    ]
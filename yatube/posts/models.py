@@ -1,7 +1,10 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
 
 from core.models import CreatedModel
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -40,17 +43,45 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         ordering = ('-created',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['created'], name='post_created_idx'),
+            models.Index(
+                fields=['author', 'created'],
+                name='post_author_created_idx'
+            ),
+            models.Index(
+                fields=['group', 'created'],
+                name='post_group_created_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:CHAR_CUT]
 
+    def save(self, *args, **kwargs):
+        # Счётчик комментариев обновляется только через F-выражения,
+        # поэтому при редактировании поста его устаревшее значение
+        # не должно перезаписывать актуальное.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comments_count'
+            ]
+        super().save(*args, **kwargs)
+
 
 class Comment(CreatedModel):
     post = models.ForeignKey(
@@ -70,6 +101,14 @@ class Comment(CreatedModel):
         help_text='Введите текст комментария.'
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'
+            ),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -90,3 +129,90 @@ class Follow(models.Model):
                 name='unique_booking'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'
+            ),
+        ]
+
+
+class StoredFile(models.Model):
+    """Число постов, ссылающихся на файл картинки, и её варианты."""
+    name = models.CharField(max_length=255, unique=True)
+    refs = models.PositiveIntegerField(default=0)
+    # JSON-манифест вариантов, построенных posts.thumbnails.generate;
+    # пустая строка — варианты ещё не готовы.
+    variants = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return self.name
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Число подписок',
+        default=0
+    )
+    # Посты «тяжёлого» автора не раскладываются по лентам, а подмешиваются
+    # при чтении (posts.timeline).
+    heavy = models.BooleanField('Тяжёлый автор', default=False)
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    created = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-post'],
+                name='timeline_user_created_idx'
+            ),
+        ]
+
+
+class UploadSession(CreatedModel):
+    """Загрузка картинки по частям, которую можно возобновить."""
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    filename = models.CharField('Имя файла', max_length=255)
+    size = models.PositiveIntegerField('Размер файла')
+    received = models.PositiveIntegerField('Получено байтов', default=0)
+    # Имя готового файла в хранилище; пусто, пока загрузка не завершена.
+    name = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return self.filename
@@ -0,0 +1,194 @@
+"""Загрузка картинок постов по частям с возобновлением.
+
+Клиент открывает сессию, сообщив имя и размер файла, и отправляет куски
+не больше CHUNK_SIZE по порядку, указывая смещение и SHA-256 куска.
+Куски дописываются в файл сессии в каталоге приёма хранилища; после
+обрыва клиент узнаёт, сколько байтов уже получено, и продолжает с этого
+места. Последний кусок запускает проверку и обработку картинки
+(posts.uploads) и сохранение в хранилище. Формы поста получают только
+токен сессии и ссылаются на готовый файл по имени.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.validators import validate_image_file_extension
+from django.db import transaction
+from django.utils import timezone
+
+from . import storage, uploads
+from .models import Post, UploadSession
+from .storage import INCOMING_DIR
+
+
+CHUNK_SIZE = 1024 * 1024
+READ_SIZE = 64 * 1024
+SESSION_SECONDS = 24 * 60 * 60
+
+
+class OffsetMismatch(Exception):
+    """Кусок пришёл не с того смещения, с которого ждёт сервер."""
+
+    def __init__(self, offset):
+        super().__init__(offset)
+        self.offset = offset
+
+
+class CorruptChunk(Exception):
+    """Кусок дошёл не целиком или не совпал с контрольной суммой."""
+
+
+class _PartFile(UploadedFile):
+    """Собранный файл сессии: uploads.process читает его с диска."""
+
+    def __init__(self, path, name):
+        super().__init__(
+            open(path, 'rb'), name, None, os.path.getsize(path)
+        )
+        self._path = path
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def _storage():
+    return Post._meta.get_field('image').storage
+
+
+def part_path(session):
+    return _storage().path(f'{INCOMING_DIR}/{session.token}.part')
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def start(user, filename, size):
+    """Открывает сессию загрузки файла filename размером size байтов."""
+    validate_image_file_extension(UploadedFile(name=filename))
+    if not 0 < size <= settings.IMAGE_UPLOAD_MAX_SIZE:
+        raise ValidationError(uploads.size_error())
+    session = UploadSession.objects.create(
+        user=user, filename=os.path.basename(filename), size=size
+    )
+    path = part_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return session
+
+
+def _receive(stream, length, checksum, check_signature):
+    """Читает кусок во временный файл и проверяет его."""
+    chunk = tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR)
+    digest = hashlib.sha256()
+    remaining = length
+    while remaining:
+        data = stream.read(min(READ_SIZE, remaining))
+        if not data:
+            break
+        digest.update(data)
+        chunk.write(data)
+        remaining -= len(data)
+    chunk.seek(0)
+    if remaining or (checksum and checksum.lower() != digest.hexdigest()):
+        chunk.close()
+        raise CorruptChunk
+    if check_signature and not uploads.known_signature(chunk.read(READ_SIZE)):
+        chunk.close()
+        raise ValidationError(uploads.FORMAT_ERROR)
+    chunk.seek(0)
+    return chunk
+
+
+def append(session, offset, stream, length, checksum=None):
+    """Дописывает кусок из stream; возвращает число полученных байтов.
+
+    Кусок с чужим смещением отклоняется с OffsetMismatch, недошедший
+    или с неверной контрольной суммой — с CorruptChunk; полученное ранее
+    при этом не меняется, и кусок можно отправить снова.
+    """
+    if session.name or offset != session.received:
+        raise OffsetMismatch(session.received)
+    if not 0 < length <= CHUNK_SIZE or offset + length > session.size:
+        raise ValidationError(
+            f'Кусок должен быть не больше {CHUNK_SIZE} байтов '
+            'и не выходить за размер файла.'
+        )
+    # Кусок сначала целиком принимается отдельно: файл сессии меняет
+    # только запрос, сдвинувший received.
+    with _receive(stream, length, checksum, offset == 0) as chunk:
+        with transaction.atomic():
+            # Условное UPDATE блокирует строку сессии до конца транзакции,
+            # поэтому запись в файл сессии не пересекается с другим
+            # запросом, а зависший повтор того же куска её не трогает.
+            updated = UploadSession.objects.filter(
+                pk=session.pk, received=offset, name=''
+            ).update(received=offset + length)
+            if not updated:
+                session.refresh_from_db()
+                raise OffsetMismatch(session.received)
+            with open(part_path(session), 'r+b') as part:
+                part.seek(offset)
+                shutil.copyfileobj(chunk, part, READ_SIZE)
+    session.received = offset + length
+    if session.received == session.size:
+        _complete(session)
+    return session.received
+
+
+def _complete(session):
+    path = part_path(session)
+    part = _PartFile(path, session.filename)
+    try:
+        file = uploads.process(part)
+        with storage.holding():
+            session.name = _storage().save(
+                Post._meta.get_field('image').generate_filename(
+                    None, session.filename
+                ),
+                file
+            )
+            # Ссылка сессии; её отпускает удаление сессии.
+            storage.acquire(session.name)
+        file.close()
+    except Exception:
+        # Повторять загрузку этого файла бессмысленно: сессия закрывается.
+        session.delete()
+        raise
+    finally:
+        part.close()
+        _remove(path)
+    UploadSession.objects.filter(pk=session.pk).update(name=session.name)
+
+
+def completed(user, token):
+    """Завершённая сессия пользователя по токену или None."""
+    return UploadSession.objects.filter(
+        user=user, token=token
+    ).exclude(name='').first()
+
+
+def clear_expired(now=None):
+    """Удаляет сессии старше SESSION_SECONDS и их файлы.
+
+    Готовый файл удаляется вместе со ссылкой сессии, только если на него
+    не ссылается ни один пост. Возвращает число удалённых сессий.
+    """
+    now = now or timezone.now()
+    expired = UploadSession.objects.filter(
+        created__lt=now - timedelta(seconds=SESSION_SECONDS)
+    )
+    count = 0
+    for session in expired.iterator():
+        _remove(part_path(session))
+        session.delete()
+        count += 1
+    return count
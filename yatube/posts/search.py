@@ -0,0 +1,178 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite используется внешняя FTS5-таблица над posts_post,
+которую синхронизируют триггеры на вставку, изменение и удаление.
+На других СУБД поиск откатывается к LIKE по тексту поста.
+"""
+import hashlib
+import re
+
+from django.db import connection, connections, router
+from django.db.models.expressions import RawSQL
+
+from core.caching import get_or_refresh
+from . import generations
+from .models import Post
+
+
+FTS_TABLE = 'posts_post_fts'
+MAX_TERMS = 8
+RESULTS_SECONDS = 60
+
+INSTALL_SQL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai
+        AFTER INSERT ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad
+        AFTER DELETE ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF text ON posts_post BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+            VALUES ('delete', old.id, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END""",
+)
+TRIGGERS = (f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au')
+
+
+def install(conn=connection):
+    """Создаёт индекс и триггеры; перестраивает индекс, если их не было.
+
+    SQLite-миграции Django пересоздают таблицу posts_post при изменении
+    её полей, и триггеры при этом теряются, поэтому функция вызывается
+    и из миграции, и после каждого migrate.
+    """
+    if conn.vendor != 'sqlite':
+        return
+    if Post._meta.db_table not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' "
+            f"AND name IN ({', '.join(['%s'] * len(TRIGGERS))})",
+            TRIGGERS
+        )
+        complete = cursor.fetchone()[0] == len(TRIGGERS)
+        for statement in INSTALL_SQL:
+            cursor.execute(statement)
+        if not complete:
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+
+
+def parse_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def to_match(terms):
+    """Строка FTS5 MATCH: каждое слово — префиксный поиск в кавычках."""
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset посты, подходящие под запрос (без ранжирования)."""
+    terms = parse_terms(query)
+    if not terms:
+        return queryset.none()
+    if connection.vendor != 'sqlite':
+        for term in terms:
+            queryset = queryset.filter(text__icontains=term)
+        return queryset
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        (to_match(terms),)
+    ))
+
+
+def ranked_ids(terms, offset, limit):
+    if connection.vendor != 'sqlite':
+        queryset = filter_posts(Post.objects.all(), ' '.join(terms))
+        return list(queryset.order_by('-created', '-pk').values_list(
+            'pk', flat=True
+        )[offset:offset + limit])
+    with connections[router.db_for_read(Post)].cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            'ORDER BY rank, rowid DESC LIMIT %s OFFSET %s',
+            (to_match(terms), limit, offset)
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class SearchPage:
+    """Страница результатов поиска с тем же интерфейсом, что у CursorPage.
+
+    Курсор — смещение в ранжированной выдаче. Общее число совпадений
+    не считается, поэтому ссылки на последнюю страницу нет.
+    """
+    last_cursor = None
+
+    def __init__(self, object_list, offset, per_page, has_next):
+        self.object_list = object_list
+        self.cursor = str(offset) if offset else ''
+        self.offset = offset
+        self.per_page = per_page
+        self._has_next = has_next
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self.offset > 0
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        return str(self.offset + self.per_page) if self._has_next else None
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous():
+            return None
+        return str(max(self.offset - self.per_page, 0))
+
+
+def search(query, cursor, per_page):
+    """Страница постов, отсортированных по релевантности запросу."""
+    try:
+        offset = max(int(cursor or 0), 0)
+    except ValueError:
+        offset = 0
+    terms = parse_terms(query)
+    if not terms:
+        return SearchPage([], 0, per_page, False)
+    match = to_match(terms)
+    # Популярные запросы приходят одновременно; выдачу считает один
+    # из них, пока остальные получают прежнюю.
+    ids = get_or_refresh(
+        f'search:{hashlib.md5(match.encode()).hexdigest()}'
+        f':{offset}:{per_page}',
+        lambda: ranked_ids(terms, offset, per_page + 1),
+        RESULTS_SECONDS,
+        version=generations.get_generation(generations.POSTS),
+    )
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        ids[:per_page]
+    )
+    object_list = [posts[pk] for pk in ids[:per_page] if pk in posts]
+    return SearchPage(object_list, offset, per_page, len(ids) > per_page)
@@ -0,0 +1,124 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import counters, follow_graph, generations, storage, timeline
+from .models import Comment, Follow, Group, Post, UploadSession
+
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    # Запоминаем прежние группу и картинку, чтобы сбросить кэш страниц
+    # прежней группы и освободить ссылку на прежний файл.
+    if not instance._state.adding and not raw:
+        instance._old_group_id, instance._old_image = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', 'image').first() or (None, '')
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.bump_user(instance.author_id, 'posts_count', 1)
+        timeline.fan_out(instance)
+    old_image = getattr(instance, '_old_image', '')
+    if instance.image.name != old_image:
+        storage.acquire(instance.image.name)
+        storage.release(old_image, instance.image.storage)
+    generations.bump_post(
+        instance, getattr(instance, '_old_group_id', None)
+    )
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'posts_count', -1)
+    storage.release(instance.image.name, instance.image.storage)
+    generations.bump_post(instance)
+
+
+@receiver(pre_delete, sender=UploadSession)
+def upload_session_deleting(sender, instance, **kwargs):
+    # Ссылку завершённой загрузки взял resumable._complete. Параллельные
+    # удаления одной сессии отпускают её один раз: только тот, кто
+    # первым забрал имя файла у строки сессии.
+    if instance.name and UploadSession.objects.filter(
+        pk=instance.pk, name=instance.name
+    ).update(name=''):
+        storage.release(
+            instance.name, Post._meta.get_field('image').storage
+        )
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_comments(instance.post_id, 1)
+    generations.bump_on_commit(generations.post_ns(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+    generations.bump_on_commit(generations.post_ns(instance.post_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    generations.bump_on_commit(
+        generations.group_ns(instance.pk), generations.GROUPS
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # Имя автора выводится в ленте; вход в систему меняет только
+    # last_login и на страницы не влияет.
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    # Ключи страниц групп не содержат поколений авторов, поэтому
+    # сдвигаются группы, в которых автор писал.
+    group_ids = Post.objects.filter(
+        author=instance, group__isnull=False
+    ).values_list('group_id', flat=True).distinct()
+    generations.bump_on_commit(
+        generations.POSTS, generations.author_ns(instance.pk),
+        *map(generations.group_ns, group_ids)
+    )
+
+
+def _bump_follow_counts(follow):
+    # Счётчики подписок и подписчиков выводятся в профилях обоих.
+    generations.bump_on_commit(
+        generations.author_ns(follow.author_id),
+        generations.author_ns(follow.user_id)
+    )
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, 'followers_count', 1)
+        counters.bump_user(instance.user_id, 'following_count', 1)
+        timeline.on_follow(instance)
+        _bump_follow_counts(instance)
+        generations.bump_on_commit(generations.following_ns(instance.user_id))
+        transaction.on_commit(lambda: follow_graph.refresh(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, 'followers_count', -1)
+    counters.bump_user(instance.user_id, 'following_count', -1)
+    timeline.on_unfollow(instance)
+    _bump_follow_counts(instance)
+    generations.bump_on_commit(generations.following_ns(instance.user_id))
+    transaction.on_commit(lambda: follow_graph.refresh(instance.user_id))
@@ -0,0 +1,147 @@
+"""Контентно-адресуемое хранилище картинок постов."""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+INCOMING_DIR = '.incoming'
+CAS_NAME = re.compile(r'^(?:.+/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+_held = threading.local()
+
+
+def content_name(directory, digest, extension):
+    """Путь файла с хешем digest: каталог/ab/cd/abcd...ext."""
+    return '/'.join(
+        part for part in (
+            directory, digest[:2], digest[2:4], digest + extension
+        ) if part
+    )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла — SHA-256 его содержимого.
+
+    Содержимое хешируется во время записи во временный файл, затем
+    файл переносится в двухуровневый каталог по первым символам хеша.
+    Одинаковые картинки хранятся один раз: если файл с таким хешем уже
+    есть, временный файл удаляется, а пост ссылается на существующий.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Совпадение имён означает совпадение содержимого.
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        incoming = os.path.join(self.location, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek') and content.seekable():
+            content.seek(0)
+        fd, tmp_path = tempfile.mkstemp(dir=incoming, suffix=extension)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            final_name = content_name(
+                directory, digest.hexdigest(), extension
+            )
+            final_path = self.path(final_name)
+            # Ссылка берётся до проверки файла и под той же блокировкой,
+            # под которой release перепроверяет ссылки перед удалением:
+            # существующий файл не удалят, пока на него не сошлётся пост.
+            with transaction.atomic():
+                _hold(final_name, self)
+                if os.path.exists(final_path):
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.replace(tmp_path, final_path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(final_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return final_name
+
+
+def _hold(name, storage):
+    held = getattr(_held, 'files', None)
+    if held is not None:
+        acquire(name)
+        held.append((name, storage))
+
+
+@contextmanager
+def holding():
+    """Держит ссылки на файлы, сохранённые в хранилище внутри блока.
+
+    Сохранение файла и поста, который на него сошлётся, — разные шаги;
+    без ссылки между ними одинаковый файл могли бы удалить вместе
+    с последним постом, который на него ссылался. Ссылки отпускаются
+    на выходе из блока: к этому времени пост уже держит свою.
+    """
+    outer = getattr(_held, 'files', None)
+    _held.files = []
+    try:
+        yield
+    finally:
+        files, _held.files = _held.files, outer
+        for name, storage in files:
+            release(name, storage)
+
+
+def acquire(name):
+    """Увеличивает счётчик ссылок на файл."""
+    from .models import StoredFile
+
+    if not name:
+        return
+    updated = StoredFile.objects.filter(name=name).update(refs=F('refs') + 1)
+    if not updated:
+        StoredFile.objects.get_or_create(name=name, defaults={'refs': 1})
+
+
+def release(name, storage):
+    """Уменьшает счётчик ссылок; удаляет файл, на который больше не ссылаются.
+
+    Вместе с файлом удаляются его варианты и их манифест в кэше.
+    """
+    from sorl.thumbnail import delete
+    from sorl.thumbnail.images import ImageFile
+
+    from . import thumbnails
+    from .models import StoredFile
+
+    if not name:
+        return
+    StoredFile.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1
+    )
+    deleted, _ = StoredFile.objects.filter(name=name, refs=0).delete()
+    if deleted:
+        def cleanup():
+            with transaction.atomic():
+                # До фиксации на тот же файл могли сослаться снова.
+                if StoredFile.objects.select_for_update().filter(
+                    name=name, refs__gt=0
+                ).exists():
+                    return
+                StoredFile.objects.filter(name=name).delete()
+                delete(ImageFile(name, storage))
+            thumbnails.forget(name)
+
+        transaction.on_commit(cleanup)
@@ -0,0 +1,19 @@
+from django import template
+
+from posts import thumbnails
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def ready_thumbnail(image):
+    """Варианты картинки поста (Picture) или None, пока они строятся."""
+    return thumbnails.get_ready(image)
+
+
+@register.simple_tag
+def resolve_thumbnails(posts):
+    """Находит варианты картинок постов страницы разом; ничего не выводит."""
+    thumbnails.resolve(posts)
+    return ''
@@ -1,31 +1,44 @@
+import hashlib
+import os
 import shutil
 import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import transaction
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
-from ..models import Post, Group, Comment
+from .. import resumable, uploads
+from ..models import Post, Group, Comment, StoredFile, UploadSession
+from ..storage import CAS_NAME, acquire, content_name, holding
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
 
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
 def ret_image():
-    small_gif = (
-        b'\x47\x49\x46\x38\x39\x61\x02\x00'
-        b'\x01\x00\x80\x00\x00\x00\x00\x00'
-        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-        b'\x0A\x00\x3B'
-    )
     uploaded = SimpleUploadedFile(
         name='small.gif',
-        content=small_gif,
+        content=SMALL_GIF,
         content_type='image/gif'
     )
     return uploaded
@@ -91,7 +104,9 @@ class TaskCreateFormTests(TestCase):
             author=self.user,
             text='Тестовый пост',
             group=self.group.pk,
-            image='posts/small.gif'
+            image=content_name(
+                'posts', hashlib.sha256(SMALL_GIF).hexdigest(), '.gif'
+            )
         ).exists())
 
     def test_edit_post(self):
@@ -154,3 +169,265 @@ class TaskCreateFormTests(TestCase):
             context)
         # Проверим что количество комментариев не изменилось.
         self.assertEqual(Post.objects.count(), comment_count)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_identical_uploads_are_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом со счётчиком ссылок."""
+        first = Post.objects.create(
+            author=self.user, text='Первый', image=ret_image()
+        )
+        second = Post.objects.create(
+            author=self.user, text='Второй', image=ret_image()
+        )
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            StoredFile.objects.get(name=first.image.name).refs, 2
+        )
+        first.delete()
+        self.assertEqual(
+            StoredFile.objects.get(name=second.image.name).refs, 1
+        )
+        second.image = ''
+        second.save()
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_migrate_media_moves_legacy_files(self):
+        """migrate_media переносит старые файлы в контентные пути."""
+        legacy = 'posts/legacy.gif'
+        storage = Post._meta.get_field('image').storage
+        os.makedirs(os.path.dirname(storage.path(legacy)), exist_ok=True)
+        with open(storage.path(legacy), 'wb') as legacy_file:
+            legacy_file.write(SMALL_GIF)
+        post = Post.objects.create(
+            author=self.user, text='Старый пост', image=legacy
+        )
+        call_command('migrate_media', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(CAS_NAME.match(post.image.name))
+        self.assertTrue(storage.exists(post.image.name))
+        self.assertEqual(StoredFile.objects.get().name, post.image.name)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class StoredFileRaceTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='Racer')
+        self.storage = Post._meta.get_field('image').storage
+        self.addCleanup(shutil.rmtree, TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_reused_file_is_held_until_post_is_saved(self):
+        """Файл, найденный при сохранении, не удаляется с последним постом."""
+        old = Post.objects.create(
+            author=self.user, text='Старый', image=ret_image()
+        )
+        with holding():
+            name = self.storage.save('posts/copy.gif', ret_image())
+            self.assertEqual(name, old.image.name)
+            old.delete()
+            self.assertTrue(self.storage.exists(name))
+            Post.objects.create(author=self.user, text='Новый', image=name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 1)
+
+    def test_cleanup_rechecks_refs(self):
+        """Очистка не удаляет файл, на который сослались до фиксации."""
+        post = Post.objects.create(
+            author=self.user, text='Пост', image=ret_image()
+        )
+        name = post.image.name
+        with transaction.atomic():
+            post.delete()
+            acquire(name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 1)
+
+    def test_unused_file_is_removed_after_hold(self):
+        """Файл, на который так и не сослался пост, удаляется."""
+        with holding():
+            name = self.storage.save('posts/lost.gif', ret_image())
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.exists())
+
+
+def image_upload(name, size, format_, mode='RGB', **options):
+    content = BytesIO()
+    Image.new(mode, size).save(content, format_, **options)
+    return SimpleUploadedFile(name, content.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_WORKERS=0)
+class ImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Uploader')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post_image(self, image):
+        return self.client.post(
+            reverse('posts:post_create'), {'text': 'Картинка', 'image': image}
+        )
+
+    def test_exif_is_stripped_and_large_image_downsized(self):
+        """EXIF удаляется, а слишком большая картинка уменьшается."""
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera'
+        self.post_image(image_upload(
+            'photo.jpg', (3000, 100), 'JPEG', exif=exif.tobytes()
+        ))
+        post = Post.objects.get(text='Картинка')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.width, uploads.MAX_SIDE)
+            self.assertNotIn('exif', image.info)
+
+    def test_decompression_bomb_is_rejected_before_decoding(self):
+        """Картинка больше MAX_PIXELS отклоняется по заголовку."""
+        with mock.patch.object(uploads, 'sanitize') as sanitize:
+            response = self.post_image(
+                image_upload('bomb.png', (10000, 10000), 'PNG', mode='1')
+            )
+        sanitize.assert_not_called()
+        self.assertIn(
+            'мегапикселей', response.context['form'].errors['image'][0]
+        )
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+    def test_upload_is_cut_off_at_size_limit(self):
+        """Загрузка сверх лимита и не картинка отклоняются при приёме."""
+        cases = {
+            image_upload('noise.bmp', (64, 64), 'BMP'): 'формате',
+            SimpleUploadedFile('big.gif', SMALL_GIF + bytes(2048)): 'больше',
+        }
+        for upload, error in cases.items():
+            with self.subTest(upload=upload.name):
+                response = self.post_image(upload)
+                self.assertIn(
+                    error, response.context['form'].errors['image'][0]
+                )
+        self.assertFalse(Post.objects.exists())
+
+    def test_image_views_still_check_csrf(self):
+        """Обработчик ставится до чтения формы, но CSRF проверяется."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(
+            reverse('posts:post_create'),
+            {'text': 'Картинка', 'image': ret_image()}
+        )
+        self.assertTemplateUsed(response, 'core/403csrf.html')
+        self.assertFalse(Post.objects.exists())
+
+    @mock.patch.object(uploads, 'PROCESS_SECONDS', 1)
+    def test_worker_stops_task_after_timeout(self):
+        """Процесс пула прерывает задачу, которую перестали ждать."""
+        with mock.patch.object(uploads, 'sanitize',
+                               side_effect=lambda *args: time.sleep(5)):
+            with self.assertRaises(TimeoutError):
+                uploads._sanitize_in_worker('source', 'target', 'PNG')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_WORKERS=0)
+class ResumableUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Resumer')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def put_chunk(self, url, offset, chunk, checksum=None):
+        return self.client.put(
+            url, chunk, content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest()
+        )
+
+    def test_upload_resumes_and_is_attached_by_token(self):
+        """Куски проверяются по смещению и сумме; пост получает токен."""
+        session = self.client.post(reverse('posts:upload_start'), {
+            'filename': 'small.gif', 'size': len(SMALL_GIF)
+        }).json()
+        url = session['url']
+        head, tail = SMALL_GIF[:20], SMALL_GIF[20:]
+        self.assertEqual(self.put_chunk(url, 0, head).json()['offset'], 20)
+        # Повтор уже полученного куска: сервер сообщает, где продолжить.
+        response = self.put_chunk(url, 0, head)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 20)
+        response = self.put_chunk(url, 20, tail, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(url).json()['offset'], 20)
+        self.assertTrue(self.put_chunk(url, 20, tail).json()['complete'])
+
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'По токену', 'upload': session['token']
+        })
+        post = Post.objects.get(text='По токену')
+        self.assertEqual(post.image.name, content_name(
+            'posts', hashlib.sha256(SMALL_GIF).hexdigest(), '.gif'
+        ))
+        self.assertEqual(StoredFile.objects.get().refs, 1)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_stalled_chunk_does_not_touch_received_data(self):
+        """Зависший повтор куска не портит то, что уже записал другой."""
+        session = resumable.start(self.user, 'small.gif', len(SMALL_GIF))
+        stalled = UploadSession.objects.get(pk=session.pk)
+        resumable.append(session, 0, BytesIO(SMALL_GIF[:20]), 20)
+        resumable.append(session, 20, BytesIO(SMALL_GIF[20:30]), 10)
+        with self.assertRaises(resumable.OffsetMismatch) as raised:
+            resumable.append(stalled, 0, BytesIO(b'GIF89a' + b'x' * 14), 20)
+        self.assertEqual(raised.exception.offset, 30)
+        with open(resumable.part_path(session), 'rb') as part:
+            self.assertEqual(part.read(), SMALL_GIF[:30])
+
+    def test_session_reference_is_released_once(self):
+        """Повторное удаление той же сессии не отпускает ссылку дважды."""
+        session = resumable.start(self.user, 'small.gif', len(SMALL_GIF))
+        resumable.append(session, 0, BytesIO(SMALL_GIF), len(SMALL_GIF))
+        first = UploadSession.objects.get(pk=session.pk)
+        second = UploadSession.objects.get(pk=session.pk)
+        for text in ('Первый', 'Второй'):
+            Post.objects.create(author=self.user, text=text, image=first.name)
+        first.delete()
+        second.delete()
+        self.assertEqual(StoredFile.objects.get(name=first.name).refs, 2)
+
+    def test_foreign_or_unfinished_token_is_rejected(self):
+        """Чужая или незавершённая загрузка не прикрепляется к посту."""
+        other = User.objects.create_user(username='Other')
+        foreign = resumable.start(other, 'small.gif', len(SMALL_GIF))
+        unfinished = resumable.start(self.user, 'small.gif', len(SMALL_GIF))
+        for session in (foreign, unfinished):
+            with self.subTest(user=session.user.username):
+                response = self.client.post(reverse('posts:post_create'), {
+                    'text': 'Чужая картинка', 'upload': session.token
+                })
+                self.assertTrue(response.context['form'].errors['upload'])
+        self.assertFalse(Post.objects.exists())
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post, CHAR_CUT
+from ..models import AuthorStats, Comment, Follow, Group, Post, CHAR_CUT
 
 
 User = get_user_model()
@@ -27,3 +30,52 @@ class PostGroupModelTest(TestCase):
         """Правильное формирование имени поста, группы."""
         self.assertEqual(self.group.__str__(), self.group.title)
         self.assertEqual(self.post.__str__(), self.post.text[:CHAR_CUT])
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются при создании и удалении строк."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (1, 1))
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.reader).following_count, 1
+        )
+        # Редактирование поста не затирает счётчик комментариев
+        Post.objects.filter(pk=post.pk).update(comments_count=5)
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 5)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        stats.refresh_from_db()
+        self.assertEqual((stats.posts_count, stats.followers_count), (0, 0))
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters исправляет расхождения."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='-')
+        AuthorStats.objects.filter(user=self.author).update(posts_count=7)
+        AuthorStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 1
+        )
+        self.assertTrue(AuthorStats.objects.filter(user=self.reader).exists())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
@@ -0,0 +1,276 @@
+import json
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from ..models import (Comment, Follow, Group, Post, StoredFile, TimelineEntry,
+                      UploadSession)
+from .test_views import ret_image
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+User = get_user_model()
+
+# Путь к JSON-отчёту; задаётся переменной окружения при прогоне тестов,
+# чтобы сравнивать отчёты между релизами.
+REPORT_ENV = 'QUERY_BUDGET_REPORT'
+
+AUTHORS = 30
+POSTS_PER_AUTHOR = 20
+COMMENTS_PER_POST = 15
+GROUPS = 5
+
+# Маршруты, меняющие состояние: их нельзя "прогревать" повторным запросом.
+WRITES = {
+    'posts:add_comment',
+    'posts:profile_follow',
+    'posts:profile_unfollow',
+    'users:logout',
+    'posts:upload_start',
+}
+
+QUERY_STRINGS = {
+    'posts:search': '?q=пост автора',
+}
+
+# Маршруты, которые принимают только POST, и данные для них.
+POST_DATA = {
+    'posts:upload_start': {'filename': 'small.gif', 'size': 35},
+}
+
+# Бюджеты (запросы, строки) для каждого маршрута posts, users, about и api.
+BUDGETS = {
+    'posts:index': (4, 13),
+    'posts:group_list': (5, 14),
+    'posts:post_detail': (5, 19),
+    'posts:post_create': (3, 7),
+    'posts:post_edit': (5, 9),
+    'posts:profile': (6, 44),
+    'posts:add_comment': (2, 2),
+    'posts:post_comments': (4, 20),
+    'posts:follow_index': (7, 54),
+    'posts:profile_follow': (6, 4),
+    'posts:profile_unfollow': (11, 4),
+    'posts:search': (5, 23),
+    'posts:upload_start': (3, 2),
+    'posts:upload_chunk': (3, 3),
+    'users:logout': (4, 1),
+    'users:signup': (2, 2),
+    'users:login': (2, 2),
+    'users:password_change_form': (2, 2),
+    'users:password_change_done': (2, 2),
+    'users:password_reset_form': (2, 2),
+    'users:password_reset_done': (2, 2),
+    'users:password_reset_confirm': (3, 3),
+    'users:password_reset_complete': (2, 2),
+    'about:author': (2, 2),
+    'about:tech': (2, 2),
+    'api:index': (1, 11),
+    'api:post_detail': (3, 17),
+    'api:group_list': (3, 13),
+    'api:profile': (3, 13),
+    'api:follow_index': (6, 53),
+}
+
+
+class QueryRecorder:
+    """Записывает запросы соединения и считает строки, отданные SELECT."""
+
+    def __init__(self, conn):
+        self.connection = conn
+        self.queries = []
+        self.selects = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.selects.append((sql, params))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def rows(self):
+        total = 0
+        with self.connection.cursor() as cursor:
+            for sql, params in self.selects:
+                cursor.execute(f'SELECT COUNT(*) FROM ({sql})', params)
+                total += cursor.fetchone()[0]
+        return total
+
+
+def iter_routes(resolver, namespace=''):
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace in ('posts', 'users', 'about', 'api'):
+                yield from iter_routes(pattern, pattern.namespace)
+        elif isinstance(pattern, URLPattern) and namespace:
+            yield f'{namespace}:{pattern.name}'
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryBudgetSuite(TestCase):
+    """Бюджет запросов и прочитанных строк для каждого маршрута."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report = {}
+        groups = [
+            Group.objects.create(
+                title=f'Группа {i}', slug=f'group-{i}', description='-'
+            )
+            for i in range(GROUPS)
+        ]
+        cls.authors = [
+            User.objects.create(username=f'author{i}') for i in range(AUTHORS)
+        ]
+        cls.reader = User.objects.create_user(username='reader')
+        image = ret_image()
+        for i, author in enumerate(cls.authors):
+            Follow.objects.create(user=cls.reader, author=author)
+            for j in range(POSTS_PER_AUTHOR):
+                Post.objects.create(
+                    author=author,
+                    text=f'Пост {j} автора {i}',
+                    group=groups[(i + j) % GROUPS],
+                    image=image if j % 2 else '',
+                )
+        cls.post = Post.objects.filter(
+            author=cls.reader.follower.first().author
+        ).latest('created')
+        Comment.objects.bulk_create([
+            Comment(post=post, author=cls.reader, text='Комментарий')
+            for post in Post.objects.all()
+            for _ in range(COMMENTS_PER_POST)
+        ])
+        cls.own_post = Post.objects.create(author=cls.reader, text='Свой')
+        cls.upload = UploadSession.objects.create(
+            user=cls.reader, filename='small.gif', size=35
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        path = os.getenv(REPORT_ENV)
+        if path:
+            with open(path, 'w', encoding='utf-8') as report:
+                json.dump(cls.report, report, indent=2, sort_keys=True)
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def url_for(self, name):
+        author = self.post.author.username
+        kwargs = {
+            'posts:group_list': {'slug': 'group-0'},
+            'posts:post_detail': {'post_id': self.post.pk},
+            'posts:post_edit': {'post_id': self.own_post.pk},
+            'posts:profile': {'username': author},
+            'posts:add_comment': {'post_id': self.post.pk},
+            'posts:post_comments': {'post_id': self.post.pk},
+            'api:post_detail': {'post_id': self.post.pk},
+            'api:group_list': {'slug': 'group-0'},
+            'api:profile': {'username': author},
+            'posts:profile_follow': {'username': author},
+            'posts:profile_unfollow': {'username': author},
+            'posts:upload_chunk': {'token': self.upload.token},
+            'users:password_reset_confirm': {
+                'uidb64': 'MQ', 'token': 'invalid-token'
+            },
+        }
+        return reverse(name, kwargs=kwargs.get(name)) + QUERY_STRINGS.get(
+            name, ''
+        )
+
+    def measure(self, name):
+        """Запросы страницы с уже созданными миниатюрами и пустым кэшем."""
+        client = Client()
+        client.force_login(self.reader)
+        url = self.url_for(name)
+        if name not in WRITES:
+            client.get(url)
+        cache.clear()
+        with QueryRecorder(connection) as recorder:
+            if name in POST_DATA:
+                response = client.post(url, POST_DATA[name])
+            else:
+                response = client.get(url)
+        self.assertLess(response.status_code, HTTPStatus.BAD_REQUEST, url)
+        return url, len(recorder.queries), recorder.rows()
+
+    def test_every_route_has_budget(self):
+        routes = set(iter_routes(get_resolver()))
+        self.assertEqual(routes, set(BUDGETS))
+
+    def test_routes_fit_budget(self):
+        for name, (max_queries, max_rows) in BUDGETS.items():
+            with self.subTest(view=name):
+                url, queries, rows = self.measure(name)
+                self.report[name] = {
+                    'url': url,
+                    'queries': queries,
+                    'rows': rows,
+                    'max_queries': max_queries,
+                    'max_rows': max_rows,
+                }
+                self.assertLessEqual(queries, max_queries)
+                self.assertLessEqual(rows, max_rows)
+
+
+class ExplainQueriesTest(TestCase):
+    """Команда explain_queries сравнивает планы с индексами и без."""
+
+    def test_plans_use_composite_indexes(self):
+        out = StringIO()
+        call_command(
+            'explain_queries', seed=True, users=5, groups=2, posts=50,
+            comments=100, follows_per_user=3, repeat=1, stdout=out
+        )
+        before, after = out.getvalue().split('С составными индексами')
+        for index in ('post_author_created_idx', 'post_group_created_idx',
+                      'comment_post_created_idx'):
+            with self.subTest(index=index):
+                self.assertNotIn(index, before)
+                self.assertIn(index, after)
+        self.assertIn('COVERING INDEX timeline_user_created_idx', after)
+        self.assertNotIn('TEMP B-TREE', after)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class GenerateDataTest(TestCase):
+    """Команда generate_data создаёт согласованные данные."""
+
+    def test_generate_data(self):
+        call_command(
+            'generate_data', users=10, groups=2, posts=40, comments=80,
+            follows_per_user=4, images=2, stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(Comment.objects.count(), 80)
+        with_image = Post.objects.exclude(image='').count()
+        self.assertEqual(with_image, 20)
+        self.assertEqual(
+            sum(StoredFile.objects.values_list('refs', flat=True)),
+            with_image
+        )
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=follow.user).count(),
+            Post.objects.filter(
+                author__following__user=follow.user
+            ).count()
+        )
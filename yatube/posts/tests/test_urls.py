@@ -1,6 +1,7 @@
 from http import HTTPStatus
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.test import TestCase, Client
 
 from ..models import Post, Group
@@ -25,6 +26,8 @@ class StaticURLTests(TestCase):
         )
 
     def setUp(self):
+        # Шаблоны страниц проверяются по свежей отрисовке, а не по кэшу
+        cache.clear()
         # Создаем неавторизованный клиент
         self.guest_client = Client()
 
@@ -88,6 +91,12 @@ class StaticURLTests(TestCase):
         response = self.guest_client.get(page)
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
 
+    def test_empty_group(self):
+        """Группа без постов возвращает код 404"""
+        Group.objects.create(title='Пустая', slug='empty', description='-')
+        response = self.guest_client.get('/group/empty/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
     def test_urls_uses_correct_template_public_page(self):
         """Адреса ведут на правильные общедоступные шаблоны"""
         templates_url_names = {
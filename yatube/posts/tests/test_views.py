@@ -1,17 +1,27 @@
+import json
+import re
 import shutil
 import tempfile
+from concurrent.futures import Future
 from http import HTTPStatus
+from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase, override_settings
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
 from django import forms
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.db import connection, transaction
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Post, Group
-from ..views import POSTS_CUT
+from .. import follow_graph, generations, thumbnails, timeline
+from ..models import Comment, Post, Group, Follow, StoredFile, TimelineEntry
+from ..utils import get_pagi
+from ..views import COMMENTS_CUT, POSTS_CUT
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -53,6 +63,15 @@ def create_posts(cls, count):
     cls.post = Post.objects.bulk_create(obj)
 
 
+def get_two_pages(client, url):
+    """Возвращает первую и вторую страницы ленты, идя по курсору."""
+    first_page = client.get(url).context['page_obj']
+    second_page = client.get(
+        f'{url}?cursor={first_page.next_cursor}'
+    ).context['page_obj']
+    return first_page, second_page
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class TaskPagesTests(TestCase):
     @classmethod
@@ -72,6 +91,8 @@ class TaskPagesTests(TestCase):
         shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
 
     def setUp(self):
+        # Контекст страниц виден только при отрисовке, а не из кэша.
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -98,28 +119,29 @@ class TaskPagesTests(TestCase):
     def test_pages_context(self):
         """Тестирование страниц на наличие правильного контекста
          + паджинатор"""
-        page_2 = '?page=2'
         second = COUNT_POSTS - POSTS_CUT
-        response_tuple = (
-            (POSTS_CUT, reverse('posts:index')),
-            (second, reverse('posts:index') + page_2),
-            (POSTS_CUT, reverse(
-                'posts:group_list', kwargs={'slug': self.group.slug}
-            )),
-            (second, reverse(
-                'posts:group_list', kwargs={'slug': self.group.slug}
-            ) + page_2),
-            (POSTS_CUT, reverse(
-                'posts:profile', kwargs={'username': self.user.username}
-            )),
-            (second, reverse(
-                'posts:profile', kwargs={'username': self.user.username}
-            ) + page_2),
+        pages = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
         )
-        for count, template in response_tuple:
-            with self.subTest(template=template):
-                response = self.authorized_client.get(template)
-                self.assertEqual(len(response.context['page_obj']), count)
+        for page in pages:
+            with self.subTest(page=page):
+                first_page, second_page = get_two_pages(
+                    self.authorized_client, page
+                )
+                self.assertEqual(len(first_page), POSTS_CUT)
+                self.assertEqual(len(second_page), second)
+                self.assertFalse(second_page.has_next())
+                # Курсор "назад" возвращает ровно первую страницу
+                response = self.authorized_client.get(
+                    f'{page}?cursor={second_page.previous_cursor}'
+                )
+                self.assertEqual(
+                    [post.pk for post in response.context['page_obj']],
+                    [post.pk for post in first_page]
+                )
+                self.assertFalse(response.context['page_obj'].has_previous())
 
         template = reverse(
             'posts:post_detail', kwargs={'post_id': self.post[0].id}
@@ -127,6 +149,19 @@ class TaskPagesTests(TestCase):
         response = self.authorized_client.get(template)
         self.assertEqual(response.context['post'].pk, self.post[0].id)
 
+    def test_cursor_edge_cases(self):
+        """Битый курсор даёт первую страницу, last — самые старые посты."""
+        url = reverse('posts:index')
+        response = self.authorized_client.get(url + '?cursor=broken')
+        self.assertEqual(
+            response.context['page_obj'][0].pk, self.post[-1].pk
+        )
+        response = self.authorized_client.get(url + '?cursor=last')
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[len(page_obj) - 1].pk, self.post[0].pk)
+        self.assertFalse(page_obj.has_next())
+        self.assertTrue(page_obj.has_previous())
+
     def test_data_types_form(self):
         """Проверка страниц на наличие верных типов данных"""
         template_list = [reverse(
@@ -231,16 +266,12 @@ class TaskPagesTests(TestCase):
         )
         # Проверим что количество постов стало побольше у
         # подписанного пользователя и не изменилось у не подписанного.
-        page_2 = '?page=2'
         second = COUNT_POSTS - POSTS_CUT + num_new_post
-        response_tuple = (
-            (POSTS_CUT, reverse('posts:follow_index')),
-            (second, reverse('posts:follow_index') + page_2),
+        first_page, second_page = get_two_pages(
+            authorized_client_follow, reverse('posts:follow_index')
         )
-        for count, template in response_tuple:
-            with self.subTest(template=template):
-                response = authorized_client_follow.get(template)
-                self.assertEqual(len(response.context['page_obj']), count)
+        self.assertEqual(len(first_page), POSTS_CUT)
+        self.assertEqual(len(second_page), second)
 
         response = authorized_client_dont_follow.get(
             reverse('posts:follow_index')
@@ -250,9 +281,500 @@ class TaskPagesTests(TestCase):
     def test_cache_index_page(self):
         """Тестирование кэша"""
         cache.clear()
-        response = self.authorized_client.get(reverse('posts:index'))
+        url = reverse('posts:index')
+        response = self.authorized_client.get(url)
         cache_check = response.content
-        post = Post.objects.get(pk=1)
-        post.delete()
-        response = self.authorized_client.get(reverse('posts:index'))
+        # Изменение в обход сигналов не сбрасывает кэш: страница из кэша
+        # отдаётся без запроса к постам.
+        Post.objects.filter(pk=self.post[-1].pk).update(text='Изменён')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(url)
         self.assertEqual(response.content, cache_check)
+        self.assertFalse(
+            [q for q in queries if 'posts_post' in q['sql']]
+        )
+        # Новый пост сразу сдвигает поколение и виден в ленте.
+        Post.objects.create(author=self.user, text='Свежий пост')
+        response = self.authorized_client.get(url)
+        self.assertNotEqual(response.content, cache_check)
+        self.assertContains(response, 'Свежий пост')
+
+    def test_cache_group_and_profile_pages(self):
+        """Страницы группы и профиля сбрасываются при изменении постов."""
+        cache.clear()
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        post = self.post[-1]
+        post.text = 'Отредактированный пост'
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'Отредактированный пост')
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.old_post = Post.objects.create(author=cls.author, text='Старый')
+
+    def feed(self):
+        return list(
+            timeline.get_feed(self.reader, Post.objects.all(), 10).get_page()
+        )
+
+    def test_follow_backfills_and_unfollow_clears(self):
+        """Подписка заполняет ленту, отписка очищает её."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(author=self.author, text='Новый')
+        self.assertEqual(self.feed(), [new_post, self.old_post])
+        new_post.delete()
+        self.assertEqual(self.feed(), [self.old_post])
+        follow.delete()
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_heavy_author_is_pulled_on_read(self):
+        """Посты популярного автора не копируются, а подмешиваются."""
+        with mock.patch.object(timeline, 'FANOUT_LIMIT', 1):
+            Follow.objects.create(user=self.reader, author=self.author)
+            new_post = Post.objects.create(author=self.author, text='Новый')
+            self.assertFalse(TimelineEntry.objects.exists())
+            self.assertEqual(self.feed(), [new_post, self.old_post])
+
+    def test_heavy_author_leaves_only_below_light_limit(self):
+        """Автор у границы не раскладывается по лентам на каждой отписке."""
+        other = User.objects.create_user(username='Other')
+        with mock.patch.multiple(timeline, FANOUT_LIMIT=2, LIGHT_LIMIT=1):
+            Follow.objects.create(user=self.reader, author=self.author)
+            follow = Follow.objects.create(user=other, author=self.author)
+            self.assertTrue(timeline.is_heavy(self.author.pk))
+            TimelineEntry.objects.all().delete()
+            follow.delete()
+            self.assertTrue(timeline.is_heavy(self.author.pk))
+            self.assertFalse(TimelineEntry.objects.exists())
+            self.assertEqual(self.feed(), [self.old_post])
+            Follow.objects.filter(user=self.reader).delete()
+            self.assertFalse(timeline.is_heavy(self.author.pk))
+
+    def test_feed_pages_merge_heavy_authors(self):
+        """Страницы ленты сливают записи ленты и посты тяжёлых авторов."""
+        light = User.objects.create_user(username='Light')
+        Follow.objects.create(user=self.reader, author=light)
+        with mock.patch.object(timeline, 'FANOUT_LIMIT', 1):
+            Follow.objects.create(user=self.reader, author=self.author)
+            for i in range(3):
+                Post.objects.create(author=self.author, text=f'Тяжёлый {i}')
+                Post.objects.create(author=light, text=f'Лёгкий {i}')
+            expected = list(Post.objects.order_by('-created', '-pk'))
+            paginator = timeline.get_feed(self.reader, Post.objects.all(), 3)
+            pages = [paginator.get_page()]
+            while pages[-1].has_next():
+                pages.append(paginator.get_page(pages[-1].next_cursor))
+            self.assertEqual([post for page in pages for post in page],
+                             expected)
+            back = paginator.get_page(pages[-1].previous_cursor)
+            self.assertEqual(list(back), list(pages[-2]))
+
+    def test_follow_graph(self):
+        """Проверка подписки и тяжёлые авторы берутся из кэша."""
+        cache.clear()
+        self.assertFalse(
+            follow_graph.is_following(self.reader.pk, self.author.pk)
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(
+            follow_graph.is_following(self.reader.pk, self.author.pk)
+        )
+        timeline.heavy_authors(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(
+                follow_graph.is_following(self.reader.pk, self.author.pk)
+            )
+            self.assertEqual(timeline.heavy_authors(self.reader), [])
+        self.assertEqual(len(queries), 0)
+        follow.delete()
+        self.assertFalse(
+            follow_graph.is_following(self.reader.pk, self.author.pk)
+        )
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Searcher')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Кошки любят спать. Кошки!'
+        )
+        cls.dog = Post.objects.create(author=cls.user, text='Собака и кошка')
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return [post.pk for post in response.context['page_obj']]
+
+    def test_search_ranks_and_follows_changes(self):
+        """Поиск ранжирует выдачу и видит правки и удаления постов."""
+        self.assertEqual(self.search('кошк'), [self.cats.pk, self.dog.pk])
+        self.assertEqual(self.search('собака кошка'), [self.dog.pk])
+        self.assertEqual(self.search('!!!'), [])
+        self.dog.text = 'Только собака'
+        self.dog.save()
+        self.assertEqual(self.search('кошк'), [self.cats.pk])
+        self.cats.delete()
+        self.assertEqual(self.search('кошк'), [])
+
+    def test_pages_keep_query(self):
+        """Все ссылки паджинатора сохраняют запрос поиска."""
+        page_obj = get_pagi(Post.objects.all(), 1).get_page(None)
+        html = render_to_string('posts/includes/paginator.html', {
+            'page_obj': page_obj, 'extra_query': 'q=cats&'
+        })
+        links = re.findall(r'href="\?([^"]*)"', html)
+        self.assertEqual(len(links), 2)
+        for link in links:
+            with self.subTest(link=link):
+                self.assertTrue(link.startswith('q=cats&amp;cursor='))
+
+    def test_admin_uses_search_index(self):
+        admin_user = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin_user)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'спать'}
+        )
+        self.assertEqual(
+            [post.pk for post in response.context['cl'].result_list],
+            [self.cats.pk]
+        )
+
+
+class CommentPagesTests(TestCase):
+    COUNT_COMMENTS = COMMENTS_CUT * 2 + 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='Talker')
+        cls.post = Post.objects.create(author=cls.user, text='Обсуждаемый')
+        Comment.objects.bulk_create([
+            Comment(post=cls.post, author=cls.user, text=f'Комментарий {i}')
+            for i in range(cls.COUNT_COMMENTS)
+        ])
+        cls.ids = list(
+            cls.post.comments.order_by('created', 'pk').values_list(
+                'pk', flat=True
+            )
+        )
+
+    def test_comment_pages(self):
+        """Комментарии идут страницами от старых к новым без пропусков."""
+        response = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        ))
+        page = response.context['comments']
+        seen = [comment.pk for comment in page]
+        self.assertEqual(len(seen), COMMENTS_CUT)
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        while page.has_next():
+            response = self.client.get(url, {'cursor': page.next_cursor})
+            page = response.context['comments']
+            seen += [comment.pk for comment in page]
+        self.assertEqual(seen, self.ids)
+        self.assertContains(response, 'Комментарий')
+        self.assertNotContains(response, '<html')
+
+    def test_comments_json(self):
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        data = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual(
+            [comment['id'] for comment in data['comments']],
+            self.ids[:COMMENTS_CUT]
+        )
+        data = self.client.get(
+            url, {'format': 'json', 'cursor': data['next']}
+        ).json()
+        self.assertEqual(data['comments'][0]['id'], self.ids[COMMENTS_CUT])
+
+    def test_comments_of_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Writer')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='cond', description='-'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост', group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.urls = {
+            'post_detail': reverse(
+                'posts:post_detail', kwargs={'post_id': self.post.pk}
+            ),
+            'profile': reverse(
+                'posts:profile', kwargs={'username': self.author.username}
+            ),
+            'group_list': reverse(
+                'posts:group_list', kwargs={'slug': self.group.slug}
+            ),
+        }
+
+    def test_not_modified_without_rendering(self):
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                with CaptureQueriesContext(connection) as full:
+                    response = self.client.get(url)
+                self.assertNotIn('Last-Modified', response)
+                self.assertIn('no-cache', response['Cache-Control'])
+                with CaptureQueriesContext(connection) as revalidated:
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(
+                    response.status_code, HTTPStatus.NOT_MODIFIED
+                )
+                self.assertFalse(response.content)
+                self.assertLess(len(revalidated), len(full))
+
+    def test_if_modified_since_does_not_hide_edits(self):
+        url = self.urls['post_detail']
+        self.client.get(url)
+        self.post.text = 'Исправленный пост'
+        self.post.save()
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT'
+        )
+        self.assertContains(response, 'Исправленный пост')
+
+    def test_changes_invalidate_etag(self):
+        changes = {
+            'post_detail': lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Новый'
+            ),
+            'profile': lambda: Follow.objects.create(
+                user=self.reader, author=self.author
+            ),
+            'group_list': lambda: Post.objects.create(
+                author=self.author, text='Ещё', group=self.group
+            ),
+        }
+        for name, change in changes.items():
+            with self.subTest(page=name):
+                url = self.urls[name]
+                etag = self.client.get(url)['ETag']
+                change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_author_rename_invalidates_pages(self):
+        """Новое имя автора видно на всех страницах с его постами."""
+        etags = {name: self.client.get(url)['ETag']
+                 for name, url in self.urls.items()}
+        self.author.first_name = 'Переименованный'
+        self.author.save()
+        for name, url in self.urls.items():
+            with self.subTest(page=name):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[name]
+                )
+                self.assertContains(response, 'Переименованный')
+
+    def test_etag_depends_on_visitor(self):
+        url = self.urls['post_detail']
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+class HolePunchedPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='Writer')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.client.force_login(self.reader)
+
+    def test_page_is_shared_between_visitors(self):
+        url = reverse('posts:profile', args=[self.author.username])
+        with CaptureQueriesContext(connection) as miss:
+            response = self.author_client.get(url)
+        self.assertContains(response, 'Пользователь: Writer')
+        self.assertNotContains(response, 'Подписаться')
+        follow_graph.following_ids(self.reader.pk)
+        with CaptureQueriesContext(connection) as hit:
+            response = self.client.get(url)
+        # Страница из кэша: остаются сессия, пользователь и версия.
+        self.assertLess(len(hit), len(miss))
+        self.assertContains(response, 'Пользователь: Reader')
+        self.assertContains(response, 'Подписаться')
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(url)
+        self.assertContains(response, 'Отписаться')
+        response = Client().get(url)
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, 'Подписаться')
+
+    def test_forms_and_owner_links_are_per_visitor(self):
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        edit_url = reverse('posts:post_edit', args=[self.post.pk])
+        response = self.author_client.get(url)
+        self.assertContains(response, edit_url)
+        response = self.client.get(url)
+        self.assertNotContains(response, edit_url)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(response, '<!--hole:')
+        response = Client().get(url)
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Painter')
+        cls.post = Post.objects.create(
+            author=cls.user, text='С картинкой', image=ret_image()
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_placeholder_until_thumbnail_is_ready(self):
+        """Пока миниатюры нет, страница показывает заглушку."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            response = self.client.get(url)
+        schedule.assert_called_once_with(self.post.image.name, mock.ANY)
+        self.assertNotContains(response, '<img class="card-img')
+        self.assertContains(response, 'aspect-ratio')
+
+        # Как фоновая задача: строит миниатюру и сдвигает поколения поста,
+        # чтобы закэшированная страница с заглушкой устарела.
+        thumbnails.generate(self.post.image.name)
+        generations.bump_post(self.post)
+        response = self.client.get(url)
+        thumbnail = thumbnails.get_ready(self.post.image)
+        self.assertContains(response, thumbnail.url)
+
+    def test_variants_manifest_and_srcset(self):
+        """Варианты нескольких ширин попадают в манифест и в srcset."""
+        cache.clear()
+        thumbnails.generate(self.post.image.name)
+        manifest = json.loads(
+            StoredFile.objects.get(name=self.post.image.name).variants
+        )
+        *_, (mime_type, files) = manifest['formats']
+        # Картинка меньше 960, поэтому вариант 1440 не строится.
+        self.assertEqual([width for width, _ in files], [480, 960])
+        self.assertEqual(mime_type, 'image/jpeg')
+        generations.bump_post(self.post)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        picture = thumbnails.get_ready(self.post.image)
+        self.assertContains(response, '<picture>')
+        self.assertContains(response, f'src="{picture.url}"')
+        self.assertContains(response, f'srcset="{picture.srcset}"')
+        self.assertIn(' 480w, ', picture.srcset)
+
+    def test_resolve_reads_thumbnails_in_one_query(self):
+        """Миниатюры страницы находятся одним запросом к StoredFile."""
+        cache.clear()
+        thumbnails.generate(self.post.image.name)
+        posts = [
+            Post.objects.create(
+                author=self.user, text='Та же картинка', image=self.post.image
+            )
+            for _ in range(3)
+        ]
+        cache.clear()
+        with self.assertNumQueries(1):
+            thumbnails.resolve(posts)
+        with self.assertNumQueries(0):
+            ready = [thumbnails.get_ready(post.image) for post in posts]
+        self.assertTrue(all(thumbnail is not None for thumbnail in ready))
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_waiting_posts_are_refreshed_once_ready(self):
+        """Готовая картинка сбрасывает страницы всех постов, ждавших её."""
+        other = Post.objects.create(
+            author=self.user, text='Та же картинка', image=self.post.image
+        )
+        future = Future()
+        executor = mock.Mock(**{'submit.return_value': future})
+        name = self.post.image.name
+        with mock.patch.object(thumbnails, '_get_executor',
+                               return_value=executor), \
+                mock.patch.object(thumbnails, '_refresh') as refresh:
+            thumbnails._submit(name, self.post)
+            thumbnails._submit(name, other)
+            future.set_result(name)
+        executor.submit.assert_called_once_with(thumbnails.generate, name)
+        self.assertEqual(
+            [call.args[0] for call in refresh.call_args_list],
+            [self.post, other]
+        )
+
+    def test_failed_image_is_not_retried_on_every_render(self):
+        """Сбой запоминается, и картинка не обрабатывается при каждом показе."""
+        cache.clear()
+        name = self.post.image.name
+        with mock.patch.object(thumbnails, 'generate',
+                               side_effect=OSError) as generate, \
+                self.assertLogs(thumbnails.logger, 'ERROR'):
+            thumbnails._submit(name, self.post)
+            thumbnails._submit(name, self.post)
+            self.assertEqual(generate.call_count, 1)
+            thumbnails.forget(name)
+            thumbnails._submit(name, self.post)
+            self.assertEqual(generate.call_count, 2)
+
+
+class GenerationCommitTests(TransactionTestCase):
+    """Поколения сдвигаются ещё раз после фиксации транзакции записи."""
+
+    def test_page_cached_during_write_is_invalidated_on_commit(self):
+        author = User.objects.create_user(username='Writer')
+        with transaction.atomic():
+            Post.objects.create(author=author, text='Новый пост')
+            # Параллельный читатель видит ещё старые данные, но уже
+            # новое поколение, и сохранил бы под ним устаревшую страницу.
+            seen = generations.get_generation(
+                generations.POSTS, generations.author_ns(author.pk)
+            )
+        self.assertNotEqual(
+            generations.get_generation(
+                generations.POSTS, generations.author_ns(author.pk)
+            ),
+            seen
+        )
@@ -0,0 +1,269 @@
+"""Фоновая подготовка вариантов картинок постов.
+
+Для каждой картинки в пуле процессов строятся кадры 960x339 нескольких
+ширин в современных форматах, которые умеет кодировать Pillow, и в
+формате миниатюр sorl-thumbnail. Список файлов (манифест) хранится в
+StoredFile.variants. Шаблоны только читают манифест и выводят
+<picture> со srcset, а пока его нет, показывают заглушку, не запуская
+обработку в запросе.
+"""
+import json
+import logging
+import mimetypes
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+
+logger = logging.getLogger(__name__)
+
+BASE_WIDTH, BASE_HEIGHT = 960, 339
+GEOMETRY = f'{BASE_WIDTH}x{BASE_HEIGHT}'
+WIDTHS = (480, BASE_WIDTH, 1440)
+OPTIONS = {'crop': 'center', 'upscale': True}
+# AVIF sorl-thumbnail 12.8 не умеет называть файлы, поэтому из
+# современных форматов остаётся WebP — если Pillow собран с libwebp.
+MODERN_FORMATS = ('WEBP',)
+SIZES = f'(max-width: {BASE_WIDTH}px) 100vw, {BASE_WIDTH}px'
+MANIFEST_SECONDS = 24 * 60 * 60
+# Картинку, которую не удалось обработать, пробуем снова не раньше.
+RETRY_SECONDS = 60 * 60
+
+_executor = None
+# Имя картинки в обработке -> посты, страницы которых ждут её вариантов.
+_pending = {}
+_lock = threading.Lock()
+
+
+def _storage():
+    from .models import Post
+
+    return Post._meta.get_field('image').storage
+
+
+def _key(name):
+    return f'variants:{name}'
+
+
+def _failed_key(name):
+    return f'variants-failed:{name}'
+
+
+class Picture:
+    """Готовые варианты картинки для разметки <picture>.
+
+    Последний формат манифеста — запасной для тега <img>, остальные
+    выводятся элементами <source>.
+    """
+    sizes = SIZES
+    width = BASE_WIDTH
+    height = BASE_HEIGHT
+
+    def __init__(self, manifest):
+        *modern, (_, fallback) = json.loads(manifest)['formats']
+        self.sources = [
+            (mime_type, self._srcset(files)) for mime_type, files in modern
+        ]
+        self.srcset = self._srcset(fallback)
+        self.url = default.storage.url(dict(fallback)[BASE_WIDTH])
+
+    @staticmethod
+    def _srcset(files):
+        return ', '.join(
+            f'{default.storage.url(name)} {width}w' for width, name in files
+        )
+
+
+def get_ready(image):
+    """Готовые варианты картинки (Picture) или None; не обрабатывает её."""
+    if not image:
+        return None
+    instance = getattr(image, 'instance', None)
+    if hasattr(instance, '_picture'):
+        return instance._picture
+    from .models import StoredFile
+
+    manifest = cache.get(_key(image.name))
+    if manifest is None:
+        manifest = StoredFile.objects.filter(name=image.name).values_list(
+            'variants', flat=True
+        ).first()
+        if manifest:
+            cache.set(_key(image.name), manifest, MANIFEST_SECONDS)
+    if not manifest:
+        schedule(image.name, instance)
+        return None
+    return Picture(manifest)
+
+
+def resolve(posts):
+    """Находит варианты картинок всех постов страницы разом.
+
+    Манифесты читаются из кэша одним get_many, промахи — одним запросом
+    к StoredFile, найденное возвращается в кэш одним set_many. Итог
+    запоминается в постах, и get_ready для их картинок больше никуда
+    не обращается.
+    """
+    from .models import StoredFile
+
+    by_name = {}
+    for post in posts:
+        if post.image:
+            by_name.setdefault(post.image.name, []).append(post)
+    if not by_name:
+        return
+    cached = cache.get_many([_key(name) for name in by_name])
+    found = {
+        name: cached[_key(name)] for name in by_name if _key(name) in cached
+    }
+    missing = [name for name in by_name if name not in found]
+    if missing:
+        rows = dict(
+            StoredFile.objects.filter(name__in=missing).exclude(variants='')
+            .values_list('name', 'variants')
+        )
+        if rows:
+            cache.set_many(
+                {_key(name): manifest for name, manifest in rows.items()},
+                MANIFEST_SECONDS
+            )
+        found.update(rows)
+    for name, name_posts in by_name.items():
+        picture = Picture(found[name]) if name in found else None
+        for post in name_posts:
+            post._picture = picture
+            if picture is None:
+                schedule(name, post)
+
+
+def forget(name):
+    """Убирает манифест удалённой картинки и отметку о сбое из кэша."""
+    cache.delete_many([_key(name), _failed_key(name)])
+
+
+def _formats():
+    # None — формат миниатюр sorl по умолчанию, он же запасной.
+    Image.init()
+    return [
+        format_ for format_ in MODERN_FORMATS if format_ in Image.SAVE
+    ] + [None]
+
+
+def generate(name):
+    """Строит варианты картинки и манифест. Выполняется в процессе пула."""
+    from .models import StoredFile
+
+    storage = _storage()
+    with storage.open(name) as file:
+        source_width = Image.open(file).width
+    # Шире исходника строить незачем, но кадр 960 нужен всегда.
+    widths = [
+        width for width in WIDTHS if width <= max(source_width, BASE_WIDTH)
+    ]
+    source = ImageFile(name, storage)
+    formats = []
+    for format_ in _formats():
+        options = dict(OPTIONS, format=format_) if format_ else OPTIONS
+        files = [
+            (width, default.backend.get_thumbnail(
+                source, f'{width}x{round(width * BASE_HEIGHT / BASE_WIDTH)}',
+                **options
+            ).name)
+            for width in widths
+        ]
+        formats.append((mimetypes.guess_type(files[0][1])[0], files))
+    StoredFile.objects.update_or_create(
+        name=name, defaults={'variants': json.dumps({'formats': formats})}
+    )
+    forget(name)
+    return name
+
+
+def _init_worker():
+    import django
+
+    django.setup()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+        )
+    return _executor
+
+
+def _refresh(post):
+    # Страницы поста закэшированы с заглушкой: сдвигаем их поколения,
+    # чтобы фрагменты и ETag обновились.
+    if post is not None:
+        from . import generations
+
+        generations.bump_post(post)
+
+
+def _failed(name, error):
+    logger.error(
+        'Не удалось построить миниатюру %s', name, exc_info=error
+    )
+    cache.set(_failed_key(name), True, RETRY_SECONDS)
+
+
+def _done(future, name):
+    with _lock:
+        posts = _pending.pop(name, [])
+    if future.exception() is not None:
+        _failed(name, future.exception())
+        return
+    for post in posts:
+        _refresh(post)
+
+
+def _submit(name, post):
+    if cache.get(_failed_key(name)):
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        try:
+            generate(name)
+        except Exception as error:
+            _failed(name, error)
+            return
+        _refresh(post)
+        return
+    with _lock:
+        if name in _pending:
+            # Картинка уже в обработке: её страницы сбросит тот же вызов.
+            _pending[name].append(post)
+            return
+        _pending[name] = [post]
+    try:
+        future = _get_executor().submit(generate, name)
+    except BrokenProcessPool:
+        # Процесс пула упал: пересоздаём пул при следующей задаче.
+        global _executor
+        _executor = None
+        with _lock:
+            _pending.pop(name, None)
+        logger.error('Пул построения миниатюр перезапускается')
+        return
+    future.add_done_callback(lambda future: _done(future, name))
+
+
+def schedule(name, post=None):
+    """Ставит построение миниатюры в очередь после фиксации транзакции.
+
+    Когда миниатюра готова, сбрасываются кэши страниц поста post.
+    """
+    if name:
+        transaction.on_commit(lambda: _submit(name, post))
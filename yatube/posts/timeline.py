@@ -0,0 +1,174 @@
+"""Материализованная лента подписок (гибридный fan-out).
+
+Посты обычных авторов раскладываются по лентам подписчиков при записи.
+Посты авторов, у которых подписчиков не меньше FANOUT_LIMIT, в ленты
+не копируются: при чтении они подмешиваются запросом по автору. Обратно
+в обычные автор возвращается, только когда подписчиков меньше
+LIGHT_LIMIT, поэтому подписки и отписки автора у границы не раскладывают
+его посты по лентам всех подписчиков каждый раз.
+"""
+from . import follow_graph, generations
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .utils import CursorPaginator, keyset, row_key
+
+
+FANOUT_LIMIT = 1000
+LIGHT_LIMIT = 750
+BATCH_SIZE = 500
+# Страховка на случай, когда отметку тяжёлых авторов правят в обход
+# этого модуля (генератор данных).
+HEAVY_SECONDS = 600
+
+
+def _stats(author_id):
+    """(число подписчиков, тяжёлый ли автор)."""
+    return AuthorStats.objects.filter(user_id=author_id).values_list(
+        'followers_count', 'heavy'
+    ).first() or (0, False)
+
+
+def is_heavy(author_id):
+    return _stats(author_id)[1]
+
+
+def _mark_heavy(author_id, heavy):
+    AuthorStats.objects.filter(user_id=author_id).update(heavy=heavy)
+    generations.bump(generations.HEAVY_AUTHORS)
+
+
+def heavy_ids():
+    """Отсортированный массив id всех тяжёлых авторов."""
+    return follow_graph.cached_ids(
+        'follow_graph:heavy', generations.HEAVY_AUTHORS,
+        lambda: AuthorStats.objects.filter(heavy=True).values_list(
+            'user_id', flat=True
+        ),
+        HEAVY_SECONDS,
+    )
+
+
+def heavy_authors(user):
+    """id авторов из подписок user, посты которых подтягиваются при чтении."""
+    heavy = heavy_ids()
+    return [
+        author_id for author_id in follow_graph.following_ids(user.pk)
+        if follow_graph.contains(heavy, author_id)
+    ]
+
+
+def _bulk_add(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if is_heavy(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _bulk_add([
+        TimelineEntry(user_id=user_id, post=post, created=post.created)
+        for user_id in follower_ids
+    ])
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя все посты автора."""
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'created'
+    )
+    _bulk_add([
+        TimelineEntry(user_id=user_id, post_id=post_id, created=created)
+        for post_id, created in posts.iterator()
+    ])
+
+
+def on_follow(follow):
+    count, heavy = _stats(follow.author_id)
+    if heavy:
+        return
+    if count >= FANOUT_LIMIT:
+        _mark_heavy(follow.author_id, True)
+    else:
+        backfill(follow.user_id, follow.author_id)
+
+
+def on_unfollow(follow):
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id
+    ).delete()
+    count, heavy = _stats(follow.author_id)
+    # Автор перестал быть тяжёлым: его посты больше не подмешиваются
+    # при чтении, поэтому их нужно разложить по лентам оставшихся
+    # подписчиков.
+    if heavy and count < LIGHT_LIMIT:
+        _mark_heavy(follow.author_id, False)
+        follower_ids = Follow.objects.filter(
+            author_id=follow.author_id
+        ).values_list('user_id', flat=True)
+        for user_id in follower_ids.iterator():
+            backfill(user_id, follow.author_id)
+
+
+def entry_keys(user_id, created=None, pk=None, newest_first=True):
+    """Ключи (created, id) постов из ленты пользователя.
+
+    Читаются по индексу timeline_user_created_idx без обращения к постам.
+    """
+    return keyset(
+        TimelineEntry.objects.filter(user_id=user_id),
+        created, pk, newest_first, 'post_id'
+    ).values_list('created', 'post_id')
+
+
+def author_keys(author_id, created=None, pk=None, newest_first=True):
+    """Ключи (created, id) постов автора по индексу post_author_created_idx."""
+    return keyset(
+        Post.objects.filter(author_id=author_id),
+        created, pk, newest_first
+    ).values_list('created', 'pk')
+
+
+class FeedPaginator(CursorPaginator):
+    """Keyset-паджинатор ленты подписок.
+
+    Ключи страницы сливаются из записей ленты и из постов каждого
+    тяжёлого автора: каждый поток читает не больше per_page + 1 ключей
+    по своему индексу. Сами посты выбираются одним запросом по id.
+    """
+
+    def __init__(self, user, queryset, per_page, descending=True):
+        super().__init__(queryset, per_page, descending)
+        self.user = user
+
+    def _window(self, created, pk, reverse=False):
+        newest_first = self.descending != reverse
+        limit = self.per_page + 1
+        keys = set(entry_keys(
+            self.user.pk, created, pk, newest_first
+        )[:limit])
+        for author_id in heavy_authors(self.user):
+            # Пост мог попасть в ленту, пока автор ещё не был тяжёлым:
+            # множество убирает повторы.
+            keys.update(author_keys(
+                author_id, created, pk, newest_first
+            )[:limit])
+        keys = sorted(keys, reverse=newest_first)[:limit]
+        if not keys:
+            return []
+        rows = {
+            row_key(row)[1]: row
+            for row in self.queryset.filter(
+                pk__in=[post_id for _, post_id in keys]
+            ).order_by()
+        }
+        # Пост могли удалить между запросами.
+        return [rows[post_id] for _, post_id in keys if post_id in rows]
+
+
+def get_feed(user, queryset, per_page, descending=True):
+    """Паджинатор ленты подписок пользователя по строкам queryset постов."""
+    return FeedPaginator(user, queryset, per_page, descending)
@@ -0,0 +1,253 @@
+"""Приём картинок постов с ограничением памяти.
+
+Загрузка пишется во временный файл по кускам и обрывается, как только
+превышает IMAGE_UPLOAD_MAX_SIZE или первые байты не похожи на картинку.
+Проверка формата и размеров читает только заголовок файла, поэтому
+«декомпрессионная бомба» отклоняется до декодирования. Декодирование —
+удаление EXIF и уменьшение слишком больших оригиналов — выполняется
+в пуле из IMAGE_WORKERS процессов, и тяжёлая картинка не занимает
+процесс, обслуживающий запросы. Запрос ждёт обработку не дольше
+PROCESS_SECONDS; столько же задаче даёт и сам процесс пула, но вызов
+Pillow, который уже идёт, дорабатывает до конца.
+
+Обработчик загрузок ставится только представлениям с картинками
+(accepts_images), остальные загрузки сайта он не ограничивает.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import (TemporaryUploadedFile,
+                                            UploadedFile)
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# Сигнатуры первых байтов допустимых форматов.
+SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+    b'GIF87a': 'GIF',
+    b'GIF89a': 'GIF',
+    b'RIFF': 'WEBP',
+}
+FORMATS = frozenset(SIGNATURES.values())
+FORMAT_ERROR = 'Загрузите картинку в формате JPEG, PNG, GIF или WebP.'
+# 40 мегапикселей — больше, чем у любой камеры телефона.
+MAX_PIXELS = 40_000_000
+# Оригиналы шире или выше уменьшаются до этой стороны.
+MAX_SIDE = 2560
+JPEG_QUALITY = 90
+PROCESS_SECONDS = 30
+
+_executor = None
+_lock = threading.Lock()
+
+
+def size_error():
+    return f'Картинка больше {settings.IMAGE_UPLOAD_MAX_SIZE // 2 ** 20} МБ.'
+
+
+def known_signature(header):
+    return any(header.startswith(signature) for signature in SIGNATURES)
+
+
+class RejectedUpload(UploadedFile):
+    """Отклонённая при приёме загрузка: содержимого нет, есть причина."""
+
+    def __init__(self, name, reason):
+        super().__init__(file=None, name=name, size=0)
+        self.reason = reason
+
+    def close(self):
+        pass
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл и обрывает её сверх лимитов.
+
+    Остаток отклонённого файла дочитывается из запроса, но никуда
+    не пишется; в request.FILES попадает RejectedUpload с причиной,
+    которую поле формы показывает пользователю.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.reason = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.reason is not None:
+            return None
+        if start == 0 and not known_signature(raw_data):
+            self.reason = FORMAT_ERROR
+        elif start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.reason = size_error()
+        if self.reason is not None:
+            self.file.close()
+            return None
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.reason is not None:
+            return RejectedUpload(self.file_name, self.reason)
+        return super().file_complete(file_size)
+
+
+def accepts_images(view):
+    """Ставит ImageUploadHandler первым обработчиком загрузок view.
+
+    Обработчики нельзя менять после чтения request.POST, а его читает
+    CsrfViewMiddleware, поэтому CSRF проверяется уже после замены.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers.insert(0, ImageUploadHandler(request))
+        return protected(request, *args, **kwargs)
+
+    return wrapper
+
+
+def inspect(file):
+    """Формат, размеры и наличие EXIF по заголовку, без декодирования."""
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            return (
+                image.format, image.size, bool(image.info.get('exif')),
+                getattr(image, 'is_animated', False)
+            )
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError('Файл повреждён или не является картинкой.')
+    finally:
+        file.seek(0)
+
+
+def sanitize(source_path, target_path, format_):
+    """Удаляет EXIF и уменьшает картинку. Выполняется в процессе пула."""
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    with Image.open(source_path) as image:
+        # JPEG сразу декодируется с уменьшением в 2–8 раз, поэтому
+        # в памяти не оказывается полноразмерный растр.
+        image.draft(image.mode, (MAX_SIDE, MAX_SIDE))
+        icc_profile = image.info.get('icc_profile')
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_SIDE, MAX_SIDE))
+        # PNG без явного exif сохранил бы EXIF из info.
+        image.info.pop('exif', None)
+        options = {'optimize': True}
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        if format_ in ('JPEG', 'WEBP'):
+            options['quality'] = JPEG_QUALITY
+        image.save(target_path, format=format_, **options)
+    return target_path
+
+
+def _expired(signum, frame):
+    raise TimeoutError
+
+
+def _sanitize_in_worker(*args):
+    # Задача, которую запрос перестал ждать, прерывается между вызовами
+    # Pillow, а не занимает процесс пула до конца.
+    signal.signal(signal.SIGALRM, _expired)
+    signal.alarm(PROCESS_SECONDS)
+    try:
+        return sanitize(*args)
+    finally:
+        signal.alarm(0)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _run(*args):
+    global _executor
+    if not settings.IMAGE_WORKERS:
+        return sanitize(*args)
+    task = _sanitize_in_worker if hasattr(signal, 'SIGALRM') else sanitize
+    try:
+        future = _get_executor().submit(task, *args)
+        return future.result(PROCESS_SECONDS)
+    except TimeoutError:
+        # Задача, ещё стоящая в очереди, так и не запустится.
+        future.cancel()
+        raise
+    except BrokenProcessPool:
+        # Процесс пула упал (например, на нехватке памяти): пересоздаём
+        # пул при следующей загрузке.
+        with _lock:
+            _executor = None
+        raise
+
+
+def _path_of(file):
+    if hasattr(file, 'temporary_file_path'):
+        return file.temporary_file_path(), None
+    # Мелкие файлы могли прийти в памяти, например из тестов или админки.
+    copy = TemporaryUploadedFile(file.name, file.content_type, 0, None)
+    for chunk in file.chunks():
+        copy.write(chunk)
+    copy.flush()
+    return copy.temporary_file_path(), copy
+
+
+def process(file):
+    """Проверяет загруженную картинку и возвращает файл для сохранения.
+
+    Файл без EXIF и не больше MAX_SIDE возвращается как есть,
+    без перекодирования; иначе — перекодированная копия.
+    """
+    format_, (width, height), has_exif, animated = inspect(file)
+    if format_ not in FORMATS:
+        raise ValidationError(FORMAT_ERROR)
+    if width * height > MAX_PIXELS:
+        raise ValidationError(
+            f'Картинка {width}×{height} больше {MAX_PIXELS // 10 ** 6} '
+            'мегапикселей.'
+        )
+    oversized = max(width, height) > MAX_SIDE
+    if animated:
+        # Кадры анимации не перекодируются.
+        if oversized:
+            raise ValidationError(f'Анимация больше {MAX_SIDE} точек.')
+        return file
+    if not has_exif and not oversized:
+        return file
+    source_path, copy = _path_of(file)
+    result = TemporaryUploadedFile(
+        file.name, file.content_type, 0, file.charset
+    )
+    try:
+        _run(source_path, result.temporary_file_path(), format_)
+    except (OSError, TimeoutError, BrokenProcessPool):
+        result.close()
+        logger.exception('Не удалось обработать картинку %s', file.name)
+        raise ValidationError('Не удалось обработать картинку.')
+    finally:
+        if copy is not None:
+            copy.close()
+    result.size = os.path.getsize(result.temporary_file_path())
+    result.file.seek(0)
+    return result
@@ -8,9 +8,21 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path(
+        'posts/<int:post_id>/comments/',
+        views.post_comments,
+        name='post_comments'
+    ),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path('uploads/', views.upload_start, name='upload_start'),
+    path(
+        'uploads/<uuid:token>/',
+        views.upload_chunk,
+        name='upload_chunk'
+    ),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('search/', views.post_search, name='search'),
     path(
         'posts/<int:post_id>/comment/',
         views.add_comment,
@@ -1,5 +1,177 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
 
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
-def get_pagi(in_list, cut):
-    return Paginator(in_list, cut)
+
+FORWARD = 'n'
+BACKWARD = 'p'
+LAST_PAGE = 'last'
+
+
+def encode_cursor(direction, created, pk):
+    raw = f'{direction}|{created.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Возвращает (направление, created, id) или None для битого курсора."""
+    if cursor == LAST_PAGE:
+        return BACKWARD, None, None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        direction, created, pk = raw.split('|')
+        created = parse_datetime(created)
+        pk = int(pk)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        return None
+    if direction not in (FORWARD, BACKWARD) or created is None:
+        return None
+    return direction, created, pk
+
+
+def keyset(queryset, created, pk, newest_first=True, pk_field='pk'):
+    """queryset строк после ключа (created, pk) в порядке ключа.
+
+    created=None означает начало выборки.
+    """
+    if newest_first:
+        queryset = queryset.order_by('-created', f'-{pk_field}')
+        beyond = (Q(created__lt=created)
+                  | Q(created=created, **{f'{pk_field}__lt': pk}))
+    else:
+        queryset = queryset.order_by('created', pk_field)
+        beyond = (Q(created__gt=created)
+                  | Q(created=created, **{f'{pk_field}__gt': pk}))
+    if created is not None:
+        queryset = queryset.filter(beyond)
+    return queryset
+
+
+def row_key(row):
+    """Ключ (created, id) строки: модели или словаря из values()."""
+    if isinstance(row, dict):
+        return row['created'], row['id']
+    return row.created, row.pk
+
+
+class CursorPage:
+    """Страница курсорного паджинатора.
+
+    Повторяет ту часть интерфейса django.core.paginator.Page,
+    которой пользуются шаблоны, но вместо номеров страниц отдаёт курсоры.
+    Запрос выполняется при первом обращении к строкам, поэтому
+    страница, отрисованная из кэша фрагментов, не обращается к базе.
+    """
+
+    def __init__(self, paginator, cursor, direction, created, pk):
+        self.paginator = paginator
+        self.cursor = cursor or ''
+        self._direction = direction
+        self._created = created
+        self._pk = pk
+        self._rows = None
+
+    def _fetch(self):
+        if self._rows is None:
+            self._rows, self._has_next, self._has_previous = (
+                self.paginator.fetch(self._direction, self._created, self._pk)
+            )
+        return self._rows
+
+    @property
+    def object_list(self):
+        return self._fetch()
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self):
+        return len(self._fetch())
+
+    def __getitem__(self, index):
+        # Шаблоны сначала пробуют page_obj['cursor']: такой поиск
+        # не должен выполнять запрос.
+        if not isinstance(index, (int, slice)):
+            raise TypeError(
+                f'Индекс страницы должен быть int или slice, а не {index!r}'
+            )
+        return self._fetch()[index]
+
+    def has_next(self):
+        self._fetch()
+        return self._has_next
+
+    def has_previous(self):
+        self._fetch()
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        if not self.has_next() or not self.object_list:
+            return None
+        return encode_cursor(FORWARD, *row_key(self.object_list[-1]))
+
+    @property
+    def previous_cursor(self):
+        if not self.has_previous() or not self.object_list:
+            return None
+        return encode_cursor(BACKWARD, *row_key(self.object_list[0]))
+
+    @property
+    def last_cursor(self):
+        return LAST_PAGE
+
+
+class CursorPaginator:
+    """Keyset-паджинатор по паре (created, id).
+
+    Не делает COUNT(*) и не использует OFFSET: каждая страница —
+    это один запрос с условием по ключу последней показанной записи.
+    По умолчанию новые записи идут первыми; descending=False —
+    от старых к новым.
+    """
+
+    def __init__(self, queryset, per_page, descending=True):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.descending = descending
+
+    def _window(self, created, pk, reverse=False):
+        """Первые per_page + 1 строк после ключа (created, pk)."""
+        return list(keyset(
+            self.queryset, created, pk, self.descending != reverse
+        )[:self.per_page + 1])
+
+    def get_page(self, cursor=None):
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            return CursorPage(self, '', FORWARD, None, None)
+        return CursorPage(self, cursor, *decoded)
+
+    def fetch(self, direction, created, pk):
+        """Возвращает (строки, есть ли следующая, есть ли предыдущая)."""
+        if direction == FORWARD:
+            return self._page_after(created, pk)
+        return self._page_before(created, pk)
+
+    def _page_after(self, created, pk):
+        rows = self._window(created, pk)
+        has_next = len(rows) > self.per_page
+        return rows[:self.per_page], has_next, created is not None
+
+    def _page_before(self, created, pk):
+        rows = self._window(created, pk, reverse=True)
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        rows.reverse()
+        return rows, created is not None, has_previous
+
+
+def get_pagi(queryset, cut, descending=True):
+    return CursorPaginator(queryset, cut, descending)
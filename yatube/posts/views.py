@@ -1,76 +1,180 @@
-from django.shortcuts import (render,
-                              get_object_or_404,
-                              redirect,
-                              get_list_or_404)
+from urllib.parse import urlencode
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods, require_POST
+
+from core.holes import cache_page
+from core.metrics import render
 
-from .models import Post, Group, User, Follow
+from . import (counters, generations, resumable, search, storage,
+               thumbnails, timeline, uploads)
+from .conditional import (conditional_page, group_stamp, index_version,
+                          page_object, page_version, post_stamp,
+                          profile_stamp)
+from .models import Comment, Post, Group, User, Follow, UploadSession
 from .utils import get_pagi
 from .forms import PostForm, CommentForm
 
 
 POSTS_CUT = 10
+COMMENTS_CUT = 20
 
 
+@cache_page(index_version)
 def index(request):
-    page_obj = get_pagi(Post.objects.all(), POSTS_CUT)
+    page_obj = get_pagi(
+        Post.objects.select_related('author', 'group'), POSTS_CUT
+    )
     title = 'Последние обновления на сайте'
     context = {
-        'page_obj': page_obj.get_page(request.GET.get('page')),
+        'page_obj': page_obj.get_page(request.GET.get('cursor')),
         'title': title,
+        'cache_generation': generations.get_generation(
+            generations.POSTS, generations.GROUPS
+        ),
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_stamp)
+@cache_page(page_version)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    page_obj = get_pagi(get_list_or_404(Post, group=group), POSTS_CUT)
+    group = page_object(request) or get_object_or_404(Group, slug=slug)
+    page_obj = get_pagi(
+        group.posts.select_related('author', 'group'), POSTS_CUT
+    ).get_page(
+        request.GET.get('cursor')
+    )
+    # Как и раньше, группа без постов отдаёт 404.
+    if not page_obj.object_list and 'cursor' not in request.GET:
+        raise Http404
     context = {
         'group': group,
-        'page_obj': page_obj.get_page(request.GET.get('page')),
+        'page_obj': page_obj,
+        'cache_generation': generations.get_generation(
+            generations.group_ns(group.pk)
+        ),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page(profile_stamp)
+@cache_page(page_version)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    page_obj = get_pagi(author.posts.all(), POSTS_CUT)
-    following = (request.user.is_authenticated and author.following.filter(
-        user=request.user).exists())
-
+    author = page_object(request) or get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    page_obj = get_pagi(
+        author.posts.select_related('author', 'group'), POSTS_CUT
+    )
     context = {
         'author': author,
-        'page_obj': page_obj.get_page(request.GET.get('page')),
-        'page_count': page_obj.count,
-        'following': following
+        'page_obj': page_obj.get_page(request.GET.get('cursor')),
+        'page_count': counters.get_stats(author).posts_count,
+        'cache_generation': generations.get_generation(
+            generations.author_ns(author.pk), generations.GROUPS
+        ),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def get_comments_page(post_id, cursor):
+    """Страница комментариев поста, от старых к новым."""
+    return get_pagi(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        COMMENTS_CUT,
+        descending=False
+    ).get_page(cursor)
+
+
+@conditional_page(post_stamp)
+@cache_page(page_version)
 def post_detail(request, post_id):
     cut_str = 30
-    post = get_object_or_404(Post, id=post_id)
-    count_posts = post.author.posts.count()
+    post = page_object(request) or get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), id=post_id
+    )
+    count_posts = counters.get_stats(post.author).posts_count
     context = {
         'cut_str': cut_str,
         'post': post,
         'count_posts': count_posts,
-        'comments': post.comments.all(),
-        'form': CommentForm()
+        'comments': get_comments_page(
+            post.pk, request.GET.get('comments')
+        ),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующие страницы комментариев: HTML-фрагмент или JSON."""
+    get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = get_comments_page(post_id, request.GET.get('cursor'))
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            'next': comments.next_cursor,
+        })
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = search.search(query, request.GET.get('cursor'), POSTS_CUT)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'extra_query': urlencode({'q': query}) + '&' if query else '',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def save_post(post):
+    """Сохраняет пост в транзакции, которая сразу берёт блокировку записи.
+
+    Загруженная картинка пишется в хранилище до транзакции, чтобы
+    блокировка держалась только на время запросов к базе; до сохранения
+    поста файл держит storage.holding.
+    """
+    with storage.holding():
+        image = post.image
+        if image and not image._committed:
+            image.save(image.name, image.file, save=False)
+        with transaction.atomic():
+            post.save()
+
+
 @login_required
+@uploads.accepts_images
 def post_create(request):
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None
+        files=request.FILES or None,
+        user=request.user
     )
     if form.is_valid():
         new_post = form.save(commit=False)
         new_post.author = request.user
-        new_post.save()
+        save_post(new_post)
+        form.consume_upload()
+        thumbnails.schedule(new_post.image.name, new_post)
         return redirect('posts:profile', username=request.user.username)
     context = {
         'form': form,
@@ -81,16 +185,21 @@ def post_create(request):
 
 
 @login_required
+@uploads.accepts_images
 def post_edit(request, post_id):
     edit_post = get_object_or_404(Post, id=post_id)
     if edit_post.author == request.user:
         form = PostForm(
             request.POST or None,
             files=request.FILES or None,
-            instance=edit_post
+            instance=edit_post,
+            user=request.user
         )
         if form.is_valid():
-            form.save()
+            save_post(form.save(commit=False))
+            form.consume_upload()
+            if {'image', 'upload'} & set(form.changed_data):
+                thumbnails.schedule(edit_post.image.name, edit_post)
             return redirect('posts:post_detail', post_id=post_id)
         context = {
             'form': form,
@@ -102,25 +211,95 @@ def post_edit(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def _upload_state(session):
+    return {
+        'token': str(session.token),
+        'url': reverse('posts:upload_chunk', args=[session.token]),
+        'size': session.size,
+        'offset': session.received,
+        'chunk_size': resumable.CHUNK_SIZE,
+        'complete': bool(session.name),
+    }
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    """Открывает сессию загрузки картинки по частям."""
+    try:
+        session = resumable.start(
+            request.user, request.POST.get('filename', ''),
+            int(request.POST.get('size', ''))
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Укажите размер файла.'}, status=400)
+    except ValidationError as error:
+        return JsonResponse({'error': ' '.join(error.messages)}, status=400)
+    return JsonResponse(_upload_state(session), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def upload_chunk(request, token):
+    """Сколько байтов получено (GET) или следующий кусок файла (PUT).
+
+    Кусок — тело запроса; смещение передаётся в заголовке Upload-Offset,
+    SHA-256 куска — в X-Chunk-SHA256.
+    """
+    session = get_object_or_404(
+        UploadSession, token=token, user=request.user
+    )
+    if request.method == 'PUT':
+        try:
+            offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Укажите смещение куска.'}, status=400
+            )
+        try:
+            resumable.append(
+                session, offset, request, length,
+                request.META.get('HTTP_X_CHUNK_SHA256')
+            )
+        except resumable.OffsetMismatch:
+            # Клиент продолжает с offset из ответа.
+            return JsonResponse({
+                **_upload_state(session), 'error': 'Неверное смещение куска.'
+            }, status=409)
+        except resumable.CorruptChunk:
+            return JsonResponse({
+                **_upload_state(session),
+                'error': 'Кусок повреждён, отправьте его снова.'
+            }, status=400)
+        except ValidationError as error:
+            return JsonResponse(
+                {'error': ' '.join(error.messages)}, status=400
+            )
+    return JsonResponse(_upload_state(session))
+
+
 @login_required
 def add_comment(request, post_id):
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
-        comment.post = Post.objects.get(id=post_id)
-        comment.save()
+        with transaction.atomic():
+            comment.post = Post.objects.get(id=post_id)
+            comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
-    page_obj = get_pagi(Post.objects.filter(
-        author__following__user=request.user
-    ), POSTS_CUT)
+    page_obj = timeline.get_feed(
+        request.user, Post.objects.select_related('author', 'group'),
+        POSTS_CUT
+    )
     title = 'Подписки'
     context = {
-        'page_obj': page_obj.get_page(request.GET.get('page')),
+        'page_obj': page_obj.get_page(request.GET.get('cursor')),
         'title': title,
     }
     return render(request, 'posts/follow.html', context)
@@ -130,12 +309,14 @@ def follow_index(request):
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        with transaction.atomic():
+            Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('posts:profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    with transaction.atomic():
+        Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('posts:profile', username=username)
@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -44,6 +46,7 @@ INSTALLED_APPS = [
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -55,6 +58,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,6 +74,10 @@ INTERNAL_IPS = [
     '127.0.0.1',
 ]
 
+# Токен для /metrics (заголовок Authorization: Bearer <токен>);
+# без него метрики не отдаются.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'yatube.urls'
 
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -97,13 +106,69 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
+# Профиль SQLite: concurrent — WAL, mmap, ожидание блокировок,
+# постоянные соединения и транзакции BEGIN IMMEDIATE; default — как
+# в стандартном бэкенде Django.
+SQLITE_PROFILES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
+    'concurrent': {
+        'ENGINE': 'core.db.backends.sqlite3',
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA busy_timeout=15000;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA temp_store=MEMORY'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+}
+SQLITE_PROFILE = SQLITE_PROFILES[os.getenv('SQLITE_PROFILE', 'concurrent')]
+
+DATABASES = {
+    'default': {
+        **SQLITE_PROFILE,
+        'NAME': os.getenv(
+            'DATABASE_PATH', os.path.join(BASE_DIR, 'db.sqlite3')
+        ),
     }
 }
 
+# Реплики только для чтения: пути к файлам SQLite через запятую.
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+    filter(None, os.getenv('DATABASE_REPLICAS', '').split(','))
+):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **SQLITE_PROFILE,
+        'NAME': name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+# Тесты маршрутизации читают из отдельной реплики. Псевдоним объявлен
+# только при запуске тестов и получает данные копированием из default.
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    DATABASES['test_replica'] = {
+        **SQLITE_PROFILE,
+        'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+        'TEST': {'NAME': os.path.join(
+            tempfile.gettempdir(), f'yatube_replica_{os.getpid()}.sqlite3'
+        )},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+# Сколько секунд после записи посетитель читает из основной базы.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -157,8 +222,31 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Число процессов, строящих миниатюры в фоне; 0 — строить сразу
+# в процессе, сохранившем пост.
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+
+# Картинки постов пишутся на диск по кускам и обрываются сверх лимита
+# размера (posts.uploads.accepts_images); удаление EXIF и уменьшение
+# больших картинок выполняют IMAGE_WORKERS процессов (0 — в процессе
+# запроса).
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Кэш в файле SQLite общий для всех процессов на машине: фрагменты,
+# поколения и миниатюры не дублируются в каждом воркере.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv(
+            'CACHE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 50000)),
+        },
     }
 }
+# Тесты работают с кэшем во временном каталоге.
+TEST_RUNNER = 'core.test_runner.TestRunner'